@@ -1,10 +1,8 @@
 from django.apps import AppConfig
+from django.conf import settings
 import asyncio
 import os
 import threading
-import time
-from django.core.cache import cache
-from .consumers import CrashGameConsumer
 
 
 class CrashConfig(AppConfig):
@@ -12,37 +10,18 @@ class CrashConfig(AppConfig):
     name = "crash"
 
     def ready(self):
+        # Engine se inace pokrece sa `manage.py run_game_engines`
+        if not settings.GAME_ENGINES["IN_PROCESS"]:
+            return
         if os.environ.get("RUN_MAIN") != "true":  # Prevent duplicate execution
             return
         thread = threading.Thread(target=self.run_async_task, daemon=True)
         thread.start()
 
     def run_async_task(self):
+        from kockarnica.engine import run_engine
+        from .engine import engines
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        print("Crash Waiting for WebSocket connection...")
-
-        game_lock = asyncio.Lock()  # Sprečava pokretanje više igara odjednom
-
-        async def game_loop():
-            while True:
-                try:
-                    is_connected = cache.get("crash_websocket_connected", False)
-                    print(is_connected)
-                    if is_connected:
-                        if not CrashGameConsumer.game_running:  # Provera da li igra već traje
-                            async with game_lock:  # Sprečava istovremeno pokretanje više igara
-                                print("WebSocket connected. Starting game...")
-                                CrashGameConsumer.game_running = True  # Obeležimo da igra počinje
-                                await CrashGameConsumer.start_new_game()  # Pokreni igru
-                                CrashGameConsumer.game_running = False  # Kada završi, postavi na False
-                        else:
-                            pass
-                            #print("Crash Game already running. Waiting for the next round...")
-                    else:
-                        pass
-                        # print("WebSocket not connected yet. Retrying in 2 seconds...")
-                    await asyncio.sleep(2)  # Sprečava prebrzu proveru
-                except Exception as e:
-                    print(e)
-        loop.run_until_complete(game_loop())  # Pokreni asinhroni loop
+        rooms = [run_engine(name, game_loop) for name, game_loop in engines().items()]
+        loop.run_until_complete(asyncio.gather(*rooms))  # Pokreni asinhroni loop za svaku sobu
@@ -0,0 +1,39 @@
+import asyncio
+from functools import partial
+from django.conf import settings
+from channels.layers import get_channel_layer
+from kockarnica import presence
+from .room import CrashRoom
+
+
+async def players_present(room):
+    return await presence.aonline_count(room.presence_key) > 0
+
+
+async def wait_for_players(room):
+    """Sleep on the room's engine control channel until a player connects."""
+    channel_layer = get_channel_layer()
+    while not await players_present(room):
+        await channel_layer.receive(room.engine_channel)
+
+
+async def game_loop(room_name):
+    room = CrashRoom.get(room_name)
+    print(f"{room} waiting for WebSocket connection...")
+    while True:
+        try:
+            await wait_for_players(room)
+            print(f"WebSocket connected. Starting game in {room}...")
+            room.game_running = True  # Obeležimo da igra počinje
+            await room.start_new_game()  # Pokreni igru
+            room.game_running = False  # Kada završi, postavi na False
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(e)
+            await asyncio.sleep(1)  # Sprečava vrtenje u krug ako Redis ne radi
+
+
+def engines():
+    """Engine name -> game loop for every crash room in settings.CRASH_ROOMS."""
+    return {f"crash:{room}": partial(game_loop, room) for room in settings.CRASH_ROOMS}
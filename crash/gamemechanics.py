@@ -1 +1,142 @@
-from .models import CrashGame, CrashGameUser
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=65536)
+def crash_point_for(server_seed, client_seed, nonce):
+    """Provably fair crash point, memoized for hot rounds (verification, reveals)."""
+    hash_input = f"{server_seed}-{client_seed}-{nonce}".encode()
+    hashed = hashlib.sha256(hash_input).hexdigest()
+    return crash_point_from_number(int(hashed[:8], 16))
+
+
+def crash_point_from_number(number):
+    """Crash point for the first 32 bits of the round hash."""
+    return max(1.0,(10000.0 / (number % 10000 + 1)))
+
+
+def crash_point_rows(rows):
+    """crash_point_for over a list of (server_seed, client_seed, nonce) tuples, one process pool task."""
+    return [crash_point_for(*row) for row in rows]
+
+
+# Svaki igrac moze imati do dve opklade u rundi (slot 0 i 1)
+BET_SLOTS = 2
+
+
+def valid_slot(slot):
+    """Slot from a client message; True or 1.0 would build another bet id than the slots array."""
+    return type(slot) is int and 0 <= slot < BET_SLOTS
+
+
+def bet_id(user_id, slot):
+    """Field of a bet in the round's bet book."""
+    return f"{user_id}:{slot}"
+
+
+class RoundBook:
+    """
+    Struct-of-arrays bet book of a crash round, one row per (user, slot)
+    bet: user_ids, slots, stakes, targets (auto cashout, 0 for manual)
+    and cashed_out (multiplier paid, 0 while pending or lost).
+
+    Auto cashout rows are kept sorted by target, so every tick pays the
+    next slice with one searchsorted instead of walking the players.
+    Prefix sums over the sorted stakes keep the house exposure: the total
+    payout of the round (already paid plus what the pending bets would be
+    paid) if it ran to a given multiplier, answered in O(log n) and
+    updated in O(1) per cashout.
+    """
+
+    def __init__(self, bets=()):
+        bets = list(bets)
+        count = len(bets)
+        self.user_ids = np.fromiter((bet["user_id"] for bet in bets), dtype=np.int64, count=count)
+        self.slots = np.fromiter((bet.get("slot", 0) for bet in bets), dtype=np.int8, count=count)
+        self.stakes = np.fromiter((bet["bet_amount"] for bet in bets), dtype=np.float64, count=count)
+        self.targets = np.fromiter((bet["auto_cashout"] for bet in bets), dtype=np.float64, count=count)
+        self.cashed_out = np.fromiter((bet["cashed_out"] for bet in bets), dtype=np.float64, count=count)
+
+        auto = np.flatnonzero((self.targets > 0) & (self.cashed_out == 0))
+        self._auto_rows = auto[np.argsort(self.targets[auto], kind="stable")]
+        self._auto_targets = self.targets[self._auto_rows]
+        self._cursor = 0
+        auto_stakes = self.stakes[self._auto_rows]
+        self._stake_sums = np.concatenate(([0.0], np.cumsum(auto_stakes)))
+        self._payout_sums = np.concatenate(([0.0], np.cumsum(auto_stakes * self._auto_targets)))
+        # Svi rucni ulozi; rucno isplaceni se oduzimaju preko set_manual_cashouts (cashout ide preko drugih workera)
+        self.manual_total = float(self.stakes[self.targets == 0].sum())
+        self.manual_stake = self.manual_total
+        self.manual_paid = 0.0
+        # Auto opklade isplacene pre nego sto je knjiga ucitana (novi lider preuzima rundu koja traje)
+        paid_auto = (self.targets > 0) & (self.cashed_out > 0)
+        self.auto_paid = float((self.stakes[paid_auto] * self.cashed_out[paid_auto]).sum())
+
+    def __len__(self):
+        return len(self.stakes)
+
+    def pop_reached(self, multiplier, crash_point=None):
+        """
+        Rows whose auto target was crossed since the last call (target <= multiplier).
+        Targets at or above the crash point are never paid.
+        """
+        end = int(np.searchsorted(self._auto_targets, multiplier, side="right"))
+        if crash_point is not None:
+            end = min(end, int(np.searchsorted(self._auto_targets, crash_point, side="left")))
+        rows = self._auto_rows[self._cursor:end]
+        self._cursor = max(self._cursor, end)
+        return rows
+
+    def exposure(self, multiplier):
+        """
+        Total payout of the round if it reaches `multiplier`: cashouts already
+        paid, auto targets at or below it paid their target, the rest and
+        the pending manual bets paid `multiplier`.
+        """
+        reached = max(self._cursor, int(np.searchsorted(self._auto_targets, multiplier, side="right")))
+        riding = self.manual_stake + self._stake_sums[-1] - self._stake_sums[reached]
+        return float(self.manual_paid + self.auto_paid + self._payout_sums[reached] + riding * multiplier)
+
+    def cap_multiplier(self, max_win):
+        """
+        Lowest multiplier at which the exposure reaches `max_win`, None if
+        it never does. Exposure is increasing and linear between targets,
+        so a bisection over the sorted targets finds the segment.
+        """
+        lo, hi = self._cursor, len(self._auto_targets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.exposure(self._auto_targets[mid]) >= max_win:
+                hi = mid
+            else:
+                lo = mid + 1
+        # Na segmentu pre targeta `lo`: exposure = paid + riding * multiplier
+        paid = self.manual_paid + self.auto_paid + self._payout_sums[lo]
+        riding = self.manual_stake + self._stake_sums[-1] - self._stake_sums[lo]
+        if riding <= 0:
+            return None
+        return max(1.0, float((max_win - paid) / riding))
+
+    def set_manual_cashouts(self, stake, paid):
+        """Stake of the manual bets cashed out so far this round and what they were paid."""
+        self.manual_stake = max(0.0, self.manual_total - stake)
+        self.manual_paid = paid
+
+    def pending(self):
+        """Rows not paid yet."""
+        return np.flatnonzero(self.cashed_out == 0)
+
+    def bet_ids(self, rows):
+        return [bet_id(user_id, slot) for user_id, slot in zip(self.user_ids[rows].tolist(), self.slots[rows].tolist())]
+
+    def winners(self):
+        """Rows that were paid, after the round is settled every other row lost."""
+        return np.flatnonzero(self.cashed_out > 0)
+
+    def payouts(self, rows):
+        """{user_id: amount} paid to `rows`, both slots of a user summed."""
+        users, inverse = np.unique(self.user_ids[rows], return_inverse=True)
+        totals = np.bincount(inverse, weights=self.stakes[rows] * self.cashed_out[rows], minlength=len(users))
+        return {int(user_id): float(total) for user_id, total in zip(users, totals)}
@@ -0,0 +1,34 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from kockarnica.seedchain import chain_path, generate_chain
+from crash.room import DEFAULT_ROOM, chain_name
+
+
+class Command(BaseCommand):
+    help = "Generate the precomputed server seed hash chain for crash (per room) or roulette rounds."
+
+    def add_arguments(self, parser):
+        parser.add_argument("game", choices=["crash", "roulette"])
+        parser.add_argument("--room", choices=list(settings.CRASH_ROOMS), default=DEFAULT_ROOM, help="Crash room the chain is for.")
+        parser.add_argument("--length", type=int, default=settings.SEED_CHAIN["LENGTH"])
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Overwrite an existing chain. Rounds already played on it can no longer be verified.",
+        )
+
+    def handle(self, *args, **options):
+        game = options["game"]
+        path = chain_path(chain_name(options["room"]) if game == "crash" else game)
+        if os.path.exists(path) and not options["force"]:
+            raise CommandError(f"{path} already exists. Use --force to overwrite it.")
+        if options["length"] < 1:
+            raise CommandError("Length must be at least 1.")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.stdout.write(f"Generating {options['length']} seeds into {path}...")
+        terminating_hash = generate_chain(path, options["length"])
+        self.stdout.write(self.style.SUCCESS(f"Terminating hash: {terminating_hash}"))
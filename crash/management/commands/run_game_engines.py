@@ -0,0 +1,50 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from kockarnica.engine import run_engine
+from kockarnica.hashring import engines_for_node
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the crash room and roulette engines in one asyncio process with Redis leader election. "
+        "With --node only the engines hashed to that node are run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", nargs="+", choices=["crash", "roulette"], default=["crash", "roulette"])
+        parser.add_argument(
+            "--node",
+            choices=settings.GAME_ENGINES["NODES"] or None,
+            help='Name of this engine process in GAME_ENGINES["NODES"].',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            asyncio.run(self.run(options["games"], options["node"]))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if settings.BALANCES["BACKEND"] == "redis":
+                from users.balances import get_balances
+                flushed = get_balances().flush()
+                self.stdout.write(f"Flushed {flushed} balances on shutdown")
+
+    async def run(self, games, node):
+        from crash.engine import engines as crash_engines
+        from roulette.engine import game_loop as roulette_game_loop
+        loops = {}
+        if "crash" in games:
+            loops.update(crash_engines())
+        if "roulette" in games:
+            loops["roulette"] = roulette_game_loop
+
+        names = engines_for_node(loops, node)
+        self.stdout.write(f"Running engines: {', '.join(names) or 'none'}")
+        tasks = [run_engine(name, loops[name]) for name in names]
+        if settings.BALANCES["BACKEND"] == "redis":
+            from users.balances import get_balances
+            tasks.append(get_balances().flush_forever())
+        await asyncio.gather(*tasks)
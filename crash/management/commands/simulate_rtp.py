@@ -0,0 +1,140 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from crash.gamemechanics import crash_point_from_number
+from roulette.gamemechanics import BET_TYPES, payout_column
+
+# Both games take the first 32 bits of a SHA-256 digest modulo MODULUS
+HASH_SPACE = 2 ** 32
+MODULUS = {"crash": 10000, "roulette": 37}
+SESSIONS_PER_TASK = 10_000
+
+
+def payout_table(game, target, bet):
+    """Multiplier paid to one bet for every `number % MODULUS` residue, built from the engine formulas."""
+    if game == "crash":
+        # Auto cashout is paid only if the target is below the crash point
+        return np.array([target if crash_point_from_number(k) > target else 0.0 for k in range(MODULUS[game])])
+    return payout_column(bet).copy()
+
+
+def residue_probabilities(modulus):
+    """Exact distribution of `number % modulus` for a uniform 32 bit number."""
+    counts = np.full(modulus, HASH_SPACE // modulus, dtype=np.float64)
+    counts[:HASH_SPACE % modulus] += 1
+    return counts / HASH_SPACE
+
+
+def simulate_batch(table, strategy, base_bet, bankroll, sessions, rounds, seed):
+    """
+    Play `sessions` independent sessions of `rounds` rounds, vectorized over
+    sessions. Returns running sums so batches from different processes can be merged.
+    """
+    rng = np.random.default_rng(seed)
+    modulus = len(table)
+    balance = np.full(sessions, bankroll, dtype=np.float64)
+    stake = np.full(sessions, base_bet, dtype=np.float64)
+    alive = np.ones(sessions, dtype=bool)
+    staked = returned = ret_sum = ret_sq_sum = 0.0
+    bets = 0
+
+    for _ in range(rounds):
+        alive &= stake <= balance
+        if not alive.any():
+            break
+        numbers = rng.integers(0, HASH_SPACE, size=sessions, dtype=np.uint64) % modulus
+        multiplier = table[numbers]
+        live_multiplier = multiplier[alive]
+        live_stake = stake[alive]
+
+        staked += live_stake.sum()
+        returned += (live_stake * live_multiplier).sum()
+        ret_sum += live_multiplier.sum()
+        ret_sq_sum += (live_multiplier ** 2).sum()
+        bets += int(alive.sum())
+
+        balance += np.where(alive, stake * (multiplier - 1), 0.0)
+        if strategy == "martingale":
+            stake = np.where(multiplier > 0, base_bet, stake * 2)
+
+    return {
+        "staked": staked,
+        "returned": returned,
+        "ret_sum": ret_sum,
+        "ret_sq_sum": ret_sq_sum,
+        "bets": bets,
+        "ruined": int((~alive).sum()),
+        "sessions": sessions,
+        "final_balance": float(balance.sum()),
+    }
+
+
+class Command(BaseCommand):
+    help = "Monte Carlo RTP, variance and bankroll risk for the crash and roulette payout formulas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("game", choices=["crash", "roulette"])
+        parser.add_argument("--rounds", type=int, default=100_000_000, help="Total rounds to simulate.")
+        parser.add_argument("--strategy", choices=["flat", "martingale"], default="flat")
+        parser.add_argument("--target", type=float, default=2.0, help="Crash auto cashout multiplier.")
+        parser.add_argument("--bet", default="red", help="Roulette bet position, e.g. red, odd, dozen:2, split:1-2.")
+        parser.add_argument("--base-bet", type=float, default=1.0)
+        parser.add_argument("--bankroll", type=float, default=100.0)
+        parser.add_argument("--session-rounds", type=int, default=1000, help="Rounds per bankroll session.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        game = options["game"]
+        if game == "crash" and options["target"] <= 1.0:
+            raise CommandError("Auto cashout must be greater than 1.0!")
+        if options["rounds"] < options["session_rounds"]:
+            raise CommandError("Rounds must be at least one session.")
+        if game == "roulette" and options["bet"].lower() not in BET_TYPES:
+            raise CommandError(f"Unknown roulette bet {options['bet']}.")
+
+        table = payout_table(game, options["target"], options["bet"].lower())
+        probabilities = residue_probabilities(MODULUS[game])
+        exact_rtp = float((probabilities * table).sum())
+        exact_variance = float((probabilities * table ** 2).sum()) - exact_rtp ** 2
+
+        sessions = options["rounds"] // options["session_rounds"]
+        tasks = [min(SESSIONS_PER_TASK, sessions - i) for i in range(0, sessions, SESSIONS_PER_TASK)]
+        seeds = np.random.SeedSequence(options["seed"]).spawn(len(tasks))
+        self.stdout.write(
+            f"Simulating {sessions * options['session_rounds']} {game} rounds "
+            f"({options['strategy']}) on {options['workers']} workers..."
+        )
+
+        total = {}
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = [
+                pool.submit(
+                    simulate_batch, table, options["strategy"], options["base_bet"],
+                    options["bankroll"], task_sessions, options["session_rounds"], seed,
+                )
+                for task_sessions, seed in zip(tasks, seeds)
+            ]
+            for future in futures:
+                for key, value in future.result().items():
+                    total[key] = total.get(key, 0) + value
+
+        if not total["bets"]:
+            raise CommandError("Bankroll is smaller than the base bet, nothing was played.")
+        mean = total["ret_sum"] / total["bets"]
+        variance = total["ret_sq_sum"] / total["bets"] - mean ** 2
+        rtp = total["returned"] / total["staked"]
+
+        self.stdout.write(f"Bets placed:        {total['bets']}")
+        self.stdout.write(f"Exact RTP (flat):   {exact_rtp:.6%}  house edge {1 - exact_rtp:.6%}")
+        self.stdout.write(f"Exact variance:     {exact_variance:.6f}")
+        self.stdout.write(f"Simulated RTP:      {rtp:.6%}  house edge {1 - rtp:.6%}")
+        self.stdout.write(f"Per bet return:     mean {mean:.6f}  variance {variance:.6f}  "
+                          f"std err {np.sqrt(variance / total['bets']):.6f}")
+        self.stdout.write(f"Risk of ruin:       {total['ruined'] / total['sessions']:.4%} "
+                          f"of {total['sessions']} sessions ({options['bankroll']} bankroll, "
+                          f"{options['session_rounds']} rounds)")
+        self.stdout.write(f"Mean final balance: {total['final_balance'] / total['sessions']:.2f}")
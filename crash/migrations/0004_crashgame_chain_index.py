@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crash", "0003_alter_crashgame_users"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crashgame",
+            name="chain_index",
+            field=models.IntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crash", "0004_crashgame_chain_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="crashgame",
+            index=models.Index(
+                fields=["server_seed", "client_seed", "nonce"], name="crash_verify_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crash", "0005_crashgame_crash_verify_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crashgame",
+            name="room",
+            field=models.CharField(default="default", max_length=32),
+        ),
+        migrations.AlterField(
+            model_name="crashgame",
+            name="chain_index",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="crashgame",
+            constraint=models.UniqueConstraint(
+                fields=("room", "chain_index"), name="crash_room_chain_index_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crash", "0006_crashgame_room"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crashgameuser",
+            name="slot",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
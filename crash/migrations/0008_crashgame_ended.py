@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+def mark_played_rounds(apps, schema_editor):
+    CrashGame = apps.get_model("crash", "CrashGame")
+    CrashGame.objects.filter(game_running=False).update(ended=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("crash", "0007_crashgameuser_slot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crashgame",
+            name="ended",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_played_rounds, migrations.RunPython.noop),
+    ]
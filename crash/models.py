@@ -2,12 +2,14 @@ from django.db import models
 import hashlib
 import secrets
 from asgiref.sync import sync_to_async
+from .gamemechanics import crash_point_for
 
 # Create your models here.
 class CrashGameUser(models.Model):
     game = models.ForeignKey("crash.CrashGame", on_delete=models.CASCADE, related_name="players")
     user = models.ForeignKey("users.User", on_delete=models.CASCADE)
     bet_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    slot = models.PositiveSmallIntegerField(default=0)
     is_out = models.BooleanField(default=False)
     cashout_multiplier = models.DecimalField(max_digits=10, decimal_places=2, default=1.0)
     entry_time = models.DateTimeField(auto_now_add=True)
@@ -36,15 +38,27 @@ class CrashGameUser(models.Model):
 
 
 class CrashGame(models.Model):
+    room = models.CharField(max_length=32, default="default")
     server_seed = models.CharField(max_length=64, unique=True)
     client_seed = models.CharField(max_length=64, default="default_client_seed")
     hashed_server_seed = models.CharField(max_length=64)
     nonce = models.IntegerField(default=0)
     crash_point = models.FloatField(default=1.0)
+    chain_index = models.IntegerField(null=True, blank=True)
     game_running = models.BooleanField(default=False)
+    # Runda je odigrana; redovi sledece runde nastaju ranije (tokom odbrojavanja) i seed im je tajan
+    ended = models.BooleanField(default=False)
 
     users = models.ManyToManyField("users.User", related_name="crash_games")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["server_seed", "client_seed", "nonce"], name="crash_verify_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["room", "chain_index"], name="crash_room_chain_index_uniq"),
+        ]
+
     def __str__(self):
         return f"Game {self.id} - {'Running' if self.game_running else 'Finished'}" 
 
@@ -58,10 +72,7 @@ class CrashGame(models.Model):
     
     def calculate_crash(self):
         """Calculate the crash point for the game"""
-        hash_input = f"{self.server_seed}-{self.client_seed}-{self.nonce}".encode()
-        hashed = hashlib.sha256(hash_input).hexdigest()
-        number = int(hashed[:8], 16)
-        return max(1.0,(10000.0 / (number % 10000 + 1)))
+        return crash_point_for(self.server_seed, self.client_seed, self.nonce)
     
     def save(self, *args, **kwargs):
         if not self.server_seed:
@@ -0,0 +1,546 @@
+import asyncio
+import math
+import secrets
+import time
+from functools import partial
+import numpy as np
+from django.conf import settings
+from channels.db import database_sync_to_async
+from kockarnica import broadcast, looplag
+from kockarnica.seedchain import get_chain, next_hash
+from kockarnica.betintake import BetBatcher
+from kockarnica.countdown import countdown
+from kockarnica.roundstate import ACCEPTED, BETTING, DUPLICATE, RUNNING, AlreadyJoined, RoundState, StaleRound
+from users.balances import InsufficientFunds, get_balances
+from .gamemechanics import RoundBook, bet_id, crash_point_for
+
+DEFAULT_ROOM = "default"
+
+
+def chain_name(room):
+    """Seed chain of a room; the default room keeps the original "crash" chain."""
+    return "crash" if room == DEFAULT_ROOM else f"crash-{room}"
+
+
+class CrashRoom:
+    """
+    One crash table (ws/crash/<room>/). Each room has its own group, bet
+    book, tick loop and stake limits from settings.CRASH_ROOMS.
+
+    The round itself (phase, start time, hashed seed, bet book) lives in
+    `state` so consumers on any worker can join and cash out. Only the
+    engine process that leads the room uses the in-memory fields below.
+    """
+    client_seed = "default_client_seed"
+    time_step = 0.05  # Interval u sekundama (50ms)
+    max_time = 100  # Maksimalno trajanje igre u sekundama
+    r = 0.075 # Rast faktor
+    tick_broadcast = settings.CRASH_SETTINGS["TICK_BROADCAST"]
+    resync_interval = settings.CRASH_SETTINGS["RESYNC_INTERVAL"]
+
+    _rooms = {}
+
+    @classmethod
+    def get(cls, name):
+        """Room instance for `name` in this process, None if the room is not configured."""
+        if name not in settings.CRASH_ROOMS:
+            return None
+        if name not in cls._rooms:
+            cls._rooms[name] = cls(name)
+        return cls._rooms[name]
+
+    def __init__(self, name):
+        config = settings.CRASH_ROOMS[name]
+        self.name = name
+        self.group = f"crash_{name}"
+        self.engine_channel = f"crash.engine.{name}"  # Kontrolni kanal koji budi engine
+        self.presence_key = f"crash:{name}"
+        self.chain_name = chain_name(name)
+        self.min_bet = config["MIN_BET"]
+        self.max_bet = config["MAX_BET"]
+        self.max_win = config.get("MAX_WIN")  # Najveca ukupna isplata po rundi, None = bez limita
+        self.state = RoundState(self.presence_key)
+        self.bet_intake = None
+
+        # Engine
+        self.multiplier = 1.0
+        self.game_running = False
+        self.current_game = None
+        self.next_game = None  # Runda pripremljena tokom odbrojavanja
+        self.book = RoundBook()  # Kolonski bet book runde koja traje
+        self.crash_point = None
+        self.round_anchor = None  # time.monotonic() u trenutku starta runde
+        self.round_started_at = None  # Unix timestamp (ms) starta runde, za klijente
+
+    def __str__(self):
+        return f"Crash room {self.name}"
+
+    async def add_user_to_game(self, user_id, bet_amount, auto_cashout = None, slot = 0):
+        if auto_cashout is not None :
+            if auto_cashout == 0:
+                print("Manual Cashout")
+            elif auto_cashout < 1.0:
+                print("Auto cashout must be greater than 1.0")
+                return None
+            else:
+                auto_cashout = round(auto_cashout, 2)
+                print(f"Auto cashout rounded {auto_cashout}")
+        else:
+            auto_cashout = 0
+        if (await self.state.read()).get("phase") != BETTING:
+            await self.state.queue({"user_id": user_id, "bet_amount": bet_amount, "auto_cashout": auto_cashout, "slot": slot})
+            print(f"User {user_id} added to waiting queue of {self}.")
+            return None
+
+        if self.bet_intake is None:
+            self.bet_intake = BetBatcher(self.commit_bets)
+        game_user = await self.bet_intake.submit((user_id, bet_amount, auto_cashout, slot))
+        if game_user is not None:
+            print(f"User {user_id} joined the game {game_user.game_id} immediately.")
+        return game_user
+
+    @database_sync_to_async
+    def create_game_users(self, game_id, bets):
+        from django.db import transaction
+        from .models import CrashGameUser
+        with transaction.atomic():
+            return CrashGameUser.objects.bulk_create([
+                CrashGameUser(game_id=game_id, user_id=user_id, bet_amount=bet_amount, slot=slot)
+                for user_id, bet_amount, _, slot in bets
+            ])
+
+    @database_sync_to_async
+    def save_results(self, game_id, user_ids, slots, multipliers):
+        """Mark the paid bets of a round as out, in bulk."""
+        from django.db import transaction
+        from .models import CrashGameUser
+        paid = dict(zip(zip(user_ids, slots), multipliers))
+        if not paid:
+            return
+        with transaction.atomic():
+            players = list(CrashGameUser.objects.filter(game_id=game_id, user_id__in=set(user_ids)))
+            for player in players:
+                multiplier = paid.get((player.user_id, player.slot))
+                if multiplier is not None:
+                    player.is_out = True
+                    player.cashout_multiplier = round(multiplier, 2)
+            CrashGameUser.objects.bulk_update(players, ["is_out", "cashout_multiplier"], batch_size=1000)
+
+    async def commit_bets(self, bets):
+        """
+        Commit a batch of (user_id, bet_amount, auto_cashout, slot) joins with one
+        bulk debit, one bet book script and one bulk_create. Returns per bet,
+        in order, a CrashGameUser, None if betting closed meanwhile (the bet
+        is queued for the next round) or an InsufficientFunds/AlreadyJoined error.
+        """
+        if not bets:
+            return []
+        round_id = (await self.state.read(fresh=True)).get("round_id")
+        balances = get_balances()
+        accepted = await balances.debit_many([(user_id, bet_amount) for user_id, bet_amount, _, _ in bets])
+        debited = [i for i, ok in enumerate(accepted) if ok]
+        statuses = {}
+        # Sve posle skidanja novca je u refund putanji, i greska Redis-a vraca uloge
+        try:
+            statuses = dict(zip(debited, await self.state.add_bets(round_id, [
+                (bet_id(user_id, slot), {"user_id": user_id, "slot": slot, "bet_amount": bet_amount, "auto_cashout": auto_cashout, "cashed_out": 0})
+                for user_id, bet_amount, auto_cashout, slot in (bets[i] for i in debited)
+            ]))) if round_id is not None else {}
+            joined = [bets[i] for i in debited if statuses.get(i) == ACCEPTED]
+            game_users = iter(await self.create_game_users(int(round_id), joined) if joined else [])
+        except Exception:
+            # Prihvacene opklade se vade iz bet book-a; koje ostanu (runda je krenula) igraju i ne vracaju se
+            in_book = [i for i in debited if statuses.get(i) == ACCEPTED]
+            try:
+                removed = await self.state.remove_bets(round_id, [bet_id(bets[i][0], bets[i][3]) for i in in_book])
+            except Exception as e:
+                print(f"Cannot take bets back out of {self}: {e}")
+                removed = [False] * len(in_book)
+            live = {i for i, ok in zip(in_book, removed) if not ok}
+            refunds = {}
+            for i in debited:
+                if i not in live:
+                    refunds[bets[i][0]] = refunds.get(bets[i][0], 0) + bets[i][1]
+            await balances.credit_many(refunds)
+            raise
+
+        refunds = {}
+        for i in debited:
+            if statuses.get(i) != ACCEPTED:
+                refunds[bets[i][0]] = refunds.get(bets[i][0], 0) + bets[i][1]
+        await balances.credit_many(refunds)
+
+        results = []
+        for i, (user_id, bet_amount, auto_cashout, slot) in enumerate(bets):
+            if not accepted[i]:
+                results.append(InsufficientFunds(f"User {user_id} needs {bet_amount}"))
+            elif statuses.get(i) == ACCEPTED:
+                results.append(next(game_users))
+            elif statuses.get(i) == DUPLICATE:
+                results.append(AlreadyJoined(f"User {user_id} already has a bet in slot {slot} of {self}"))
+            else:
+                await self.state.queue({"user_id": user_id, "bet_amount": bet_amount, "auto_cashout": auto_cashout, "slot": slot})
+                results.append(None)
+        print(f"Committed {len(joined)} of {len(bets)} bets in {self}")
+        return results
+
+    async def cashout_batch(self, rows, multipliers, capped=False):
+        """Pay out round book `rows` at `multipliers` (their auto targets, or the max win cap) in one go."""
+        book = self.book
+        results = await self.state.cashout(self.current_game.id, list(zip(book.bet_ids(rows), multipliers.tolist())), manual=False)
+        # Odbijeni (runda gotova, vec rucno isplaceni) se preskacu, ostali po multiplier-u koji je skripta isplatila
+        paid = np.fromiter((not isinstance(result, str) for result in results), dtype=bool, count=len(rows))
+        multipliers = np.fromiter((0 if isinstance(result, str) else result[1] for result in results), dtype=np.float64, count=len(rows))
+        rows, multipliers = rows[paid], multipliers[paid]
+        if not len(rows):
+            return
+
+        book.cashed_out[rows] = multipliers
+        await get_balances().credit_many(book.payouts(rows))
+        print(f"{'Max win cap' if capped else 'Auto'} cashed out {len(rows)} bets")
+        message = {
+            "status": "cashout",
+            "cashouts": [
+                {"user_id": user_id, "slot": slot, "amount": amount, "multiplier": multiplier}
+                for user_id, slot, amount, multiplier in zip(
+                    book.user_ids[rows].tolist(),
+                    book.slots[rows].tolist(),
+                    (book.stakes[rows] * multipliers).tolist(),
+                    multipliers.tolist(),
+                )
+            ],
+        }
+        if capped:
+            message["max_win"] = self.max_win
+        await self.send_to_group(message)
+
+    async def cap_multiplier(self):
+        """Multiplier at which the round's exposure hits max_win, None without a cap or if it never does."""
+        if self.max_win is None:
+            return None
+        state = await self.state.read()
+        self.book.set_manual_cashouts(float(state.get("manual_out", 0)), float(state.get("manual_paid", 0)))
+        cap = self.book.cap_multiplier(self.max_win)
+        # Cena ide na cent nadole, da isplata ne predje limit
+        return None if cap is None else math.floor(cap * 100) / 100
+
+    def current_multiplier(self, state):
+        """Multiplier of a running round from the start timestamp in its round state."""
+        if state.get("phase") != RUNNING:
+            return None
+        return (1 + self.r) ** ((time.time() * 1000 - int(state["started_at"])) / 1000)
+
+    async def cashout(self, user_id, slot=0):
+        """
+        Manual cashout at the current clock multiplier, returns the message for
+        the player. Works from any worker, the bet book script decides.
+        """
+        state = await self.state.read()
+        current = self.current_multiplier(state)
+        if current is None:
+            return {"status": "error", "message": "Round is not running."}
+
+        result = (await self.state.cashout(state["round_id"], [(bet_id(user_id, slot), round(current,2))], manual=True))[0]
+        if result == "closed":
+            return {"status": "error", "message": "Round is not running."}
+        if result == "auto":
+            return {"status": "error", "message": "Auto cashout is already set."}
+        if result == "missing":
+            return {"status": "error", "message": "Cannot cashout, not in game or already cashed out."}
+
+        # Skripta isplacuje najvise do max win cap-a runde
+        bet_amount, multiplier = result
+        cashout_amount = bet_amount * multiplier
+        await get_balances().credit(user_id, cashout_amount)
+        print(f"Cashed out successfuly {cashout_amount}")
+        return {
+            "status": "cashout",
+            "message": f"User {user_id} cashed out {cashout_amount} with multiplier {multiplier}"
+        }
+
+    @database_sync_to_async
+    def last_chain_index(self):
+        from django.db.models import Max
+        from .models import CrashGame
+        last = CrashGame.objects.filter(room=self.name).aggregate(Max("chain_index"))["chain_index__max"]
+        return -1 if last is None else last
+
+    @database_sync_to_async
+    def last_nonce(self):
+        from django.db.models import Max
+        from .models import CrashGame
+        last = CrashGame.objects.filter(room=self.name).aggregate(Max("nonce"))["nonce__max"]
+        return -1 if last is None else last
+
+    async def next_round_seed(self):
+        """
+        (server_seed, hashed_server_seed, nonce, chain_index) for the next round.
+        Pops the room's precomputed seed chain when it exists, otherwise makes a random seed.
+        """
+        chain = get_chain(self.chain_name)
+        if chain is None:
+            server_seed = secrets.token_hex(16)
+            # Nonce je brojac rundi sobe, ceo broj kao u bazi, da provera racuna isti hash
+            return server_seed, next_hash(server_seed), await self.last_nonce() + 1, None
+        if chain.cursor is None:
+            chain.cursor = await self.last_chain_index() + 1
+        index, server_seed = chain.pop()
+        return server_seed, next_hash(server_seed), index, index
+
+    @database_sync_to_async
+    def get_game(self, game_id):
+        from .models import CrashGame
+        return CrashGame.objects.filter(id=game_id, room=self.name).first()
+
+    async def prepare_round(self, previous):
+        """
+        Seeds, DB row and betting phase of the next round, with the queued
+        bets committed. Runs during the previous round's countdown. Betting
+        only opens over round `previous`, raises StaleRound otherwise.
+        """
+        from asgiref.sync import sync_to_async
+        from .models import CrashGame
+        server_seed, hashed_server_seed, nonce, chain_index = await self.next_round_seed()
+        new_game = await sync_to_async(CrashGame.objects.create)(
+            room=self.name,
+            server_seed=server_seed,
+            client_seed=self.client_seed,
+            hashed_server_seed=hashed_server_seed,
+            nonce=nonce,
+            chain_index=chain_index,
+            crash_point=crash_point_for(server_seed, self.client_seed, nonce),
+            game_running=False
+        )
+        try:
+            await self.state.open(new_game.id, previous, hashed_seed=hashed_server_seed)
+        except StaleRound:
+            # Runda nije otvorena, u njoj nema opklada
+            await sync_to_async(new_game.delete)()
+            raise
+        print(f"Prepared {new_game} in {self}")
+
+        queued = [
+            (bet["user_id"], bet["bet_amount"], bet["auto_cashout"], bet.get("slot", 0))
+            for bet in await self.state.drain_queue()
+        ]
+        for result in await self.commit_bets(queued):
+            if isinstance(result, Exception):
+                print(result)
+        await self.state.publish_snapshot(room=self.name)
+        return new_game
+
+    async def betting_round(self):
+        """Round left betting by a previous leader, its bets are already debited."""
+        state = await self.state.read(fresh=True)
+        if state.get("phase") != BETTING:
+            return None
+        return await self.get_game(int(state["round_id"]))
+
+    async def running_round(self):
+        """
+        (game, started_at, bet book) of a round a previous leader left
+        running, None if there is none. A running round whose DB row is
+        gone cannot be replayed, it is ended and its bets refunded.
+        """
+        state = await self.state.read(fresh=True)
+        if state.get("phase") != RUNNING:
+            return None
+        game = await self.get_game(int(state["round_id"]))
+        if game is None:
+            await self.abandon_round(state["round_id"])
+            return None
+        return game, int(state["started_at"]), await self.state.bets()
+
+    async def abandon_round(self, round_id):
+        """End `round_id` and give back the stakes of its bets that were not paid."""
+        if not await self.state.end(round_id):
+            return
+        # Bet book se cita posle end-a, kad cashout vise ne prolazi
+        refunds = {}
+        for bet in (await self.state.bets()).values():
+            if not bet["cashed_out"]:
+                refunds[bet["user_id"]] = refunds.get(bet["user_id"], 0) + bet["bet_amount"]
+        await get_balances().credit_many(refunds)
+        await self.state.publish_snapshot(room=self.name)
+        print(f"Abandoned round {round_id} of {self}, refunded {len(refunds)} users")
+
+    async def countdown(self, previous):
+        """Countdown to the next round while it is prepared after `previous`, returns the prepared game."""
+        from kockarnica import presence
+        async def announce(seconds):
+            await self.send_to_group({
+                "status": "game_ended",
+                "message": f"Game Starting in {seconds} seconds."
+            })
+        prepare = partial(self.prepare_round, previous) if await presence.aonline_count(self.presence_key) else None
+        return await countdown(10, announce, prepare)
+
+    async def start_new_game(self):
+        from kockarnica import presence
+        new_game, self.next_game = self.next_game, None
+        started = False
+        cancelled = False
+        try:
+            self.multiplier = 1.0
+            self.game_running = True
+
+            # Rundu koju je prethodni lider ostavio u toku novi lider vodi do kraja, ulozi su vec skinuti
+            resumed = await self.running_round() if new_game is None else None
+            if resumed is not None:
+                new_game, self.round_started_at, book = resumed
+                print(f"Resuming {new_game} in {self}")
+            else:
+                if new_game is None:
+                    new_game = await self.betting_round()
+                if new_game is None:
+                    if not await presence.aonline_count(self.presence_key):
+                        return
+                    # Hladan start: nema prethodnog odbrojavanja, kratak prozor za opklade
+                    new_game = await self.prepare_round((await self.state.read(fresh=True)).get("round_id"))
+                    await asyncio.sleep(2)
+                self.round_started_at = int(time.time() * 1000)
+                # Od ovog trenutka bet book je zatvoren, engine ga ucitava za auto cashout
+                book = await self.state.start(
+                    new_game.id, started_at=self.round_started_at, crash_point=new_game.crash_point, r=self.r
+                ) or {}
+            started = True
+
+            self.current_game = new_game
+            crash_point = new_game.crash_point
+            print(f"Game starting... {new_game.id}")
+
+            self.crash_point = crash_point
+            # Runda je usidrena na started_at, i kad je nastavljena
+            self.round_anchor = time.monotonic() - (time.time() * 1000 - self.round_started_at) / 1000
+            self.book = RoundBook(book.values())
+            snapshot_version = await self.state.publish_snapshot(room=self.name)
+            # Klijenti crtaju krivu lokalno: multiplier = (1 + r) ** ((now - started_at) / 1000)
+            await self.send_to_group({
+                "hash_server_seed": new_game.hashed_server_seed,
+                "status": "game_start",
+                "started_at": self.round_started_at,
+                "r": self.r,
+            })
+            # Upis u bazu ide posle starta, runda je vec usidrena na round_anchor
+            new_game.game_running = True
+            await self.save_game(new_game)
+
+            # Crash se desava tacno u crash_elapsed sekundi, nezavisno od tick-ova
+            crash_elapsed = math.log(crash_point) / math.log(1 + self.r)
+            elapsed_time = 0
+            last_tick = last_resync = -1  # Indeksi poslednjeg tick-a i resync-a na mrezi time_step * tick_factor
+            capped = False
+            stored_cap = None  # Cap upisan u rundu, rucni cashout ga cita u skripti
+            while elapsed_time < self.max_time:
+                elapsed_time = min(time.monotonic() - self.round_anchor, crash_elapsed)
+                crashed = elapsed_time >= crash_elapsed
+                self.multiplier = crash_point if crashed else (1+self.r)**elapsed_time
+
+                # Pod opterecenjem (lag event loop-a) tick-ovi se salju redje
+                tick_factor = looplag.tick_factor()
+                # Poredi se indeks koraka, ne razlika dva budjenja koja kasne razlicito
+                if self.tick_broadcast:
+                    tick = math.floor(elapsed_time / (self.time_step * tick_factor))
+                    if not crashed and tick != last_tick:
+                        last_tick = tick
+                        await self.send_to_group({"multiplier": round(self.multiplier, 2), "status": "running"}, tick=True)
+                resync = math.floor(elapsed_time / (self.resync_interval * tick_factor))
+                if not crashed and resync != last_resync:
+                    last_resync = resync
+                    if not self.tick_broadcast:
+                        await self.send_to_group({
+                            "status": "resync",
+                            "elapsed": round(elapsed_time, 3),
+                            "multiplier": round(self.multiplier, 2),
+                        }, tick=True)
+                    # Cashouti menjaju bet book, snapshot se gradi najvise jednom po resync intervalu (u oba rezima)
+                    if await self.state.version() != snapshot_version:
+                        snapshot_version = await self.state.publish_snapshot(room=self.name)
+                # Na crash-u (multiplier == crash_point) se isplacuju svi preostali dobitnici odjednom
+                cap_elapsed = float("inf")
+                if not capped:
+                    # Max win: svi preostali se isplacuju na cap multiplier-u, crash point ostaje isti (provably fair)
+                    cap = await self.cap_multiplier()
+                    if cap is not None and cap >= new_game.crash_point:
+                        cap = None
+                    value = "" if cap is None else repr(cap)
+                    if value != stored_cap:
+                        stored_cap = value
+                        await self.state.update(new_game.id, cap=value)
+                    # Auto targeti iznad cap-a se nikad ne isplacuju po svom targetu
+                    reached = self.book.pop_reached(self.multiplier if cap is None else min(self.multiplier, cap), new_game.crash_point)
+                    if len(reached):
+                        await self.cashout_batch(reached, self.book.targets[reached])
+
+                    if cap is not None:
+                        if self.multiplier >= cap:
+                            pending = self.book.pending()
+                            await self.cashout_batch(pending, np.full(len(pending), cap), capped=True)
+                            capped = True
+                        else:
+                            cap_elapsed = math.log(cap) / math.log(1 + self.r)
+
+                if crashed:
+                    break
+
+                # Bez drifta: koraci su na round_anchor + k * time_step, a poslednji tacno na crash_elapsed
+                next_step = (math.floor(elapsed_time / self.time_step) + 1) * self.time_step
+                next_wake = min(next_step, crash_elapsed, cap_elapsed)
+                await asyncio.sleep(max(0, next_wake - (time.monotonic() - self.round_anchor)))
+
+            await self.state.end(new_game.id)
+            # Konacni bet book (ukljucujuci rucne cashoute sa drugih workera): ko nije isplacen je izgubio
+            settled = RoundBook((await self.state.bets()).values())
+            winners = settled.winners()
+            await self.save_results(
+                new_game.id,
+                settled.user_ids[winners].tolist(),
+                settled.slots[winners].tolist(),
+                settled.cashed_out[winners].tolist(),
+            )
+            self.book = RoundBook()
+            await self.state.add_result({"round_id": new_game.id, "crash_point": round(new_game.crash_point,2)})
+            await self.state.publish_snapshot(room=self.name)
+            self.round_anchor = None
+            print("Game ended. Updating database...")
+            new_game.game_running = False
+            new_game.ended = True
+            await self.save_game(new_game)
+            print(new_game)
+            await self.send_to_group({
+                "crash_point": round(new_game.crash_point,2),
+                "server_seed": new_game.server_seed,
+                "nonce" : new_game.nonce,
+                "status": "game_end",
+                })
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            print(e)
+        finally:
+            self.game_running = False
+            self.round_anchor = None
+            if cancelled:
+                # Engine je izgubio lease: novi lider vec vodi sobu, ovde se nista vise ne dira
+                self.book = RoundBook()
+            elif started:
+                await self.state.end(new_game.id)
+                new_game.game_running = False
+                new_game.ended = True
+                await self.save_game(new_game)
+                self.book = RoundBook()
+                # Sledeca runda se priprema za vreme odbrojavanja
+                self.next_game = await self.countdown(new_game.id)
+            else:
+                # Runda nije krenula, njene opklade cekaju sledeci pokusaj
+                self.next_game = new_game
+
+    async def send_to_group(self, message, tick=False):
+        await broadcast.group_send(self.group, message, tick)
+
+    async def save_game(self, game = None):
+        if game is None:
+            game = self.current_game
+        from asgiref.sync import sync_to_async
+        await sync_to_async(game.save)()
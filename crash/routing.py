@@ -3,4 +3,5 @@ from .consumers import CrashGameConsumer
 
 websocket_urlpatterns = [
     path("ws/crash/", CrashGameConsumer.as_asgi()),
+    path("ws/crash/<str:room>/", CrashGameConsumer.as_asgi()),
 ]
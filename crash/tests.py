@@ -1,3 +1,65 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .gamemechanics import RoundBook, valid_slot
+
+
+def bet(user_id, bet_amount, auto_cashout=0, slot=0):
+    return {"user_id": user_id, "slot": slot, "bet_amount": bet_amount, "auto_cashout": auto_cashout, "cashed_out": 0}
+
+
+class RoundBookExposureTests(SimpleTestCase):
+    def setUp(self):
+        # Jedan auto na 5x i jedan rucni, oba po 100
+        self.book = RoundBook([bet(1, 100, 5.0), bet(2, 100)])
+
+    def test_exposure_before_any_cashout(self):
+        self.assertAlmostEqual(self.book.exposure(2.0), 400)
+        self.assertAlmostEqual(self.book.exposure(5.0), 1000)
+        self.assertAlmostEqual(self.book.exposure(7.0), 1200)
+
+    def test_exposure_keeps_paid_auto_cashouts(self):
+        before = self.book.exposure(7.0)
+        self.book.pop_reached(5.0)
+        self.assertAlmostEqual(self.book.exposure(7.0), before)
+
+    def test_exposure_keeps_paid_manual_cashouts(self):
+        self.book.set_manual_cashouts(100, 300)
+        self.assertAlmostEqual(self.book.exposure(7.0), 800)
+
+    def test_cap_multiplier(self):
+        self.assertAlmostEqual(self.book.cap_multiplier(1200), 7.0)
+        self.assertAlmostEqual(self.book.cap_multiplier(700), 3.5)
+
+    def test_cap_multiplier_does_not_move_when_money_is_paid(self):
+        self.book.pop_reached(5.0)
+        self.assertAlmostEqual(self.book.cap_multiplier(1200), 7.0)
+
+    def test_cap_multiplier_after_manual_cashout(self):
+        # Rucni je isplacen 300 na 3x, ostaje samo auto: ukupno 800, limit se ne dostize
+        self.book.set_manual_cashouts(100, 300)
+        self.assertIsNone(self.book.cap_multiplier(1200))
+        self.assertAlmostEqual(self.book.cap_multiplier(700), 4.0)
+
+    def test_pop_reached_clipped_to_cap(self):
+        book = RoundBook([bet(1, 100, 5.0), bet(2, 100, 8.0), bet(3, 100)])
+        cap = book.cap_multiplier(1700)
+        self.assertAlmostEqual(cap, 6.0)
+        rows = book.pop_reached(min(9.0, cap))
+        self.assertEqual(book.targets[rows].tolist(), [5.0])
+
+    def test_exposure_of_a_resumed_book(self):
+        # Novi lider ucitava knjigu u kojoj je auto vec isplacen na 5x, a rucni na 3x
+        book = RoundBook([dict(bet(1, 100, 5.0), cashed_out=5.0), dict(bet(2, 100), cashed_out=3.0), bet(3, 100)])
+        book.set_manual_cashouts(100, 300)
+        self.assertAlmostEqual(book.exposure(7.0), 1500)
+        self.assertAlmostEqual(book.cap_multiplier(1500), 7.0)
+
+
+class SlotTests(SimpleTestCase):
+    def test_valid_slot(self):
+        self.assertTrue(valid_slot(0))
+        self.assertTrue(valid_slot(1))
+
+    def test_rejects_out_of_range_and_non_int_slots(self):
+        for slot in (-1, 2, True, False, 1.0, "1", None):
+            self.assertFalse(valid_slot(slot), slot)
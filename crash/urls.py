@@ -1,8 +1,12 @@
 from django.urls import path
-from .views import NewGameView, RevealSeedView, VerifyGameView
+from .views import NewGameView, RevealSeedView, VerifyGameView, BatchVerifyGameView, SeedChainView, OnlineCountView, LoopLagView
 
 urlpatterns = [
     path('new_game/',NewGameView.as_view(), name="new_game"),
     path('reveal_seed/',RevealSeedView.as_view(), name="reveal_seed"),
     path('verify_game/',VerifyGameView.as_view(), name="verify_game"),
+    path('verify_games/',BatchVerifyGameView.as_view(), name="verify_games"),
+    path('seed_chain/',SeedChainView.as_view(), name="seed_chain"),
+    path('online/',OnlineCountView.as_view(), name="online"),
+    path('loop_lag/',LoopLagView.as_view(), name="loop_lag"),
 ]
@@ -1,21 +1,35 @@
 from django.shortcuts import render
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import json
+import multiprocessing
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.throttling import ScopedRateThrottle
 from .models import CrashGame
-import random as rnd
+from kockarnica import looplag, presence
+from kockarnica.seedchain import get_chain
+from .gamemechanics import crash_point_rows
+from .room import chain_name
 
 class NewGameView(APIView):
     def post(self, request):
+        # Runde pravi engine, endpoint samo vraca hash najnovije (red se pravi samo u praznoj bazi, kao ranije)
         game = CrashGame.objects.order_by("-id").first()
-        if game is None or game.nonce >= 1:
-            game = CrashGame.objects.create(nonce = rnd.uniform(0,1))
+        if game is None:
+            game = CrashGame.objects.create(nonce = 0)
         return Response({"hashed_server_seed" : game.hashed_server_seed}, status=status.HTTP_201_CREATED)
     
 class RevealSeedView(APIView):
     def get(self,request):
-        game = CrashGame.objects.order_by("-id").first()
+        # Samo odigrane runde, sledeca runda vec postoji u bazi dok se na nju kladi
+        game = CrashGame.objects.filter(ended=True, game_running=False).order_by("-id").first()
         if game:
             return Response({"server_seed" : game.server_seed}, status=status.HTTP_200_OK)
         return Response({"error" : "Game not found!"},status=status.HTTP_404_NOT_FOUND)
@@ -33,4 +47,141 @@ class VerifyGameView(APIView):
             return Response({"error" : "Game not found!"},status=status.HTTP_404_NOT_FOUND)
         
         expected_crash = game.calculate_crash()
-        return Response({"crash_point" : round(expected_crash,2)},status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response({"crash_point" : round(expected_crash,2)},status=status.HTTP_200_OK)
+
+VERIFY_CHUNK_SIZE = 1000
+_verify_pool = None
+
+
+def get_verify_pool():
+    """
+    Process pool for big verifications. Workers are spawned, not forked:
+    a fork of the threaded ASGI worker would copy locks held by its other threads.
+    """
+    global _verify_pool
+    if _verify_pool is None:
+        _verify_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+    return _verify_pool
+
+
+async def crash_points(rows, use_pool):
+    """Crash points of [(server_seed, client_seed, nonce)], computed off the event loop."""
+    if not use_pool:
+        return await sync_to_async(crash_point_rows, thread_sensitive=False)(rows)
+    loop = asyncio.get_running_loop()
+    step = VERIFY_CHUNK_SIZE // 4
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(get_verify_pool(), crash_point_rows, rows[i:i + step])
+        for i in range(0, len(rows), step)
+    ))
+    return [point for part in parts for point in part]
+
+
+async def verify_lines(games, use_pool):
+    """NDJSON lines, one per (server_seed, client_seed, nonce, game) entry."""
+    rows = [(server_seed, client_seed, nonce) for server_seed, client_seed, nonce, _ in games]
+    lines = []
+    for (server_seed, client_seed, nonce, game), expected in zip(games, await crash_points(rows, use_pool)):
+        result = {"server_seed" : server_seed, "client_seed" : client_seed, "nonce" : nonce, "found" : game is not None}
+        if game is not None:
+            result["id"] = game["id"]
+            result["crash_point"] = round(expected,2)
+            result["valid"] = round(expected,2) == round(game["crash_point"],2)
+        lines.append(json.dumps(result) + "\n")
+    return "".join(lines)
+
+
+class BatchVerifyGameView(APIView):
+    """
+    Verify many rounds in one request, either a list of
+    {"server_seed", "client_seed", "nonce"} under "rounds" or an id range
+    "from_id".."to_id". Results are streamed back as NDJSON from async
+    generators, so under ASGI each chunk is sent as soon as it is verified
+    instead of the whole response being buffered. Only rounds
+    that were played to the end are verified, the seed of the round that
+    is betting or running stays secret.
+    """
+    fields = ("id", "server_seed", "client_seed", "nonce", "crash_point")
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = "verify_games"
+
+    def post(self, request):
+        data = request.data
+        limit = settings.CRASH_SETTINGS["VERIFY_BATCH_LIMIT"]
+
+        if "rounds" in data:
+            try:
+                rounds = [
+                    (r["server_seed"], r.get("client_seed", "default_client_seed"), int(r.get("nonce", 0)))
+                    for r in data["rounds"]
+                ]
+            except (KeyError, TypeError, ValueError, AttributeError):
+                return Response({"error" : "Each round needs server_seed, client_seed and nonce!"},status=status.HTTP_400_BAD_REQUEST)
+            total = len(rounds)
+            stream = self.stream_rounds
+        elif "from_id" in data and "to_id" in data:
+            try:
+                rounds = (int(data["from_id"]), int(data["to_id"]))
+            except (TypeError, ValueError):
+                return Response({"error" : "from_id and to_id must be integers!"},status=status.HTTP_400_BAD_REQUEST)
+            total = rounds[1] - rounds[0] + 1
+            stream = self.stream_range
+        else:
+            return Response({"error" : "Send rounds or from_id and to_id!"},status=status.HTTP_400_BAD_REQUEST)
+
+        if total <= 0 or total > limit:
+            return Response({"error" : f"Between 1 and {limit} rounds per request!"},status=status.HTTP_400_BAD_REQUEST)
+
+        use_pool = total >= settings.CRASH_SETTINGS["VERIFY_POOL_THRESHOLD"]
+        return StreamingHttpResponse(stream(rounds, use_pool), content_type="application/x-ndjson")
+
+    async def stream_rounds(self, rounds, use_pool):
+        for i in range(0, len(rounds), VERIFY_CHUNK_SIZE):
+            chunk = rounds[i:i + VERIFY_CHUNK_SIZE]
+            games = await sync_to_async(list)(
+                CrashGame.objects.filter(server_seed__in=[r[0] for r in chunk], ended=True).values(*self.fields)
+            )
+            found = {(g["server_seed"], g["client_seed"], g["nonce"]): g for g in games}
+            yield await verify_lines([(*r, found.get(r)) for r in chunk], use_pool)
+
+    async def stream_range(self, id_range, use_pool):
+        # Stranice po id-u, svaka je jedan upit
+        after, last = id_range[0] - 1, id_range[1]
+        while True:
+            games = await sync_to_async(list)(
+                CrashGame.objects.filter(id__gt=after, id__lte=last, ended=True).order_by("id").values(*self.fields)[:VERIFY_CHUNK_SIZE]
+            )
+            if not games:
+                return
+            yield await verify_lines([(g["server_seed"], g["client_seed"], g["nonce"], g) for g in games], use_pool)
+            after = games[-1]["id"]
+
+
+class SeedChainView(APIView):
+    def get(self, request):
+        chains = {}
+        for game in [chain_name(room) for room in settings.CRASH_ROOMS] + ["roulette"]:
+            chain = get_chain(game)
+            if chain is not None:
+                chains[game] = {"terminating_hash" : chain.terminating_hash, "length" : chain.length}
+        if not chains:
+            return Response({"error" : "Seed chain not generated!"},status=status.HTTP_404_NOT_FOUND)
+        return Response(chains, status=status.HTTP_200_OK)
+
+
+class OnlineCountView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "crash" : {room : presence.online_count(f"crash:{room}") for room in settings.CRASH_ROOMS},
+            "roulette" : presence.online_count("roulette"),
+        }, status=status.HTTP_200_OK)
+
+
+class LoopLagView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(looplag.published_lag(), status=status.HTTP_200_OK)
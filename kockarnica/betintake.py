@@ -0,0 +1,60 @@
+"""
+Batched bet intake.
+
+Joins are collected for up to BET_INTAKE["MAX_DELAY"] seconds or
+BET_INTAKE["MAX_BATCH"] bets and committed together by the game's
+`commit` coroutine (one bulk debit and one bulk_create). Each caller of
+`submit` is resumed with its own result once its batch is committed.
+
+A batcher binds to the event loop of its first `submit`, so it is only
+used from the consumers' loop. The engine commits its waiting queue
+directly with the same `commit` coroutine.
+"""
+import asyncio
+
+from django.conf import settings
+
+
+class BetBatcher:
+    def __init__(self, commit, max_batch=None, max_delay=None):
+        self.commit = commit
+        self.max_batch = max_batch or settings.BET_INTAKE["MAX_BATCH"]
+        self.max_delay = max_delay or settings.BET_INTAKE["MAX_DELAY"]
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, bet):
+        """Queue `bet` and wait for the result `commit` returned for it."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((bet, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._commit(batch))
+
+    async def _commit(self, batch):
+        try:
+            results = await self.commit([bet for bet, _ in batch])
+        except Exception as e:
+            print(f"Bet batch failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
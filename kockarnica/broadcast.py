@@ -0,0 +1,110 @@
+"""
+Serialize-once broadcasts.
+
+A group message is encoded once by its sender, as JSON text and (with
+BROADCAST["MSGPACK"]) as a MessagePack binary frame, and every consumer
+forwards the frame its socket negotiated without touching the payload.
+Clients ask for binary frames with the "msgpack" WebSocket subprotocol;
+everyone else keeps getting JSON text frames. Frames go through the
+socket's Outbox, which conflates ticks (kockarnica/outbox.py).
+
+BROADCAST["FANOUT"] picks the delivery path: "group" uses channel layer
+groups, "pubsub" publishes once per process (kockarnica/fanout.py).
+"""
+import asyncio
+import json
+
+import msgpack
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import fanout
+from .outbox import Outbox
+
+MSGPACK = "msgpack"
+
+
+def encode(message, tick=False):
+    """
+    `message` as a send_message event carrying both wire formats. Ticks
+    may be conflated by slow sockets, every other message is delivered.
+    """
+    event = {"type": "send_message", "text": json.dumps(message), "tick": tick}
+    if settings.BROADCAST["MSGPACK"]:
+        event["bytes"] = msgpack.packb(message)
+    return event
+
+
+def pubsub_fanout():
+    return settings.BROADCAST["FANOUT"] == "pubsub"
+
+
+async def group_send(group, message, tick=False):
+    if pubsub_fanout():
+        await fanout.publish(group, encode(message, tick))
+    else:
+        await get_channel_layer().group_send(group, encode(message, tick))
+
+
+class BroadcastConsumerMixin:
+    """Frame format negotiation and outbox for AsyncWebsocketConsumer subclasses."""
+    binary = False
+    outbox = None
+
+    def negotiate_subprotocol(self):
+        """Subprotocol to pass to accept(); switches msgpack clients to binary frames."""
+        if settings.BROADCAST["MSGPACK"] and MSGPACK in self.scope.get("subprotocols", ()):
+            self.binary = True
+            return MSGPACK
+        return None
+
+    async def join_group(self, group):
+        if pubsub_fanout():
+            fanout.join(group, self)
+        else:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+    async def leave_group(self, group):
+        if pubsub_fanout():
+            fanout.leave(group, self)
+        else:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    def open_outbox(self):
+        """Start the socket's outbox, call right after accept()."""
+        self.outbox = Outbox(self._write_frame, self._outbox_overflow)
+
+    def close_outbox(self):
+        if self.outbox is not None:
+            self.outbox.close()
+            self.outbox = None
+
+    def _outbox_overflow(self):
+        print("Outbox overflow, closing slow socket.")
+        asyncio.ensure_future(self.close(code=1013))  # Try again later
+
+    async def _write_frame(self, frame):
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    def decode_frame(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            return msgpack.unpackb(bytes_data)
+        return json.loads(text_data)
+
+    async def send_frame(self, frame, tick=False):
+        """Send an already encoded frame, bytes as binary and str as text."""
+        if self.outbox is None:
+            await self._write_frame(frame)
+        else:
+            self.outbox.put(frame, tick)
+
+    async def send_event(self, message):
+        """Encode and send a message meant for this socket only."""
+        await self.send_frame(msgpack.packb(message) if self.binary else json.dumps(message))
+
+    async def send_message(self, event):
+        frame = event["bytes"] if self.binary and "bytes" in event else event["text"]
+        await self.send_frame(frame, event.get("tick", False))
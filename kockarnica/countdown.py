@@ -0,0 +1,27 @@
+"""
+Countdown between rounds that prepares the next round meanwhile.
+
+The next round's seeds, DB row and queued bets are set up while the
+countdown is shown, so when it ends the engine only has to close betting.
+Countdown messages go out on a monotonic schedule, slow sends or a busy
+event loop do not stretch the pause.
+"""
+import asyncio
+import time
+
+
+async def countdown(seconds, announce, prepare=None):
+    """
+    Await `announce(seconds_left)` once per second while the `prepare()`
+    coroutine runs, returns its result. If the countdown is cancelled the
+    preparation still finishes in the background, its bets are debited.
+    """
+    task = asyncio.ensure_future(prepare()) if prepare is not None else None
+    start = time.monotonic()
+    for x in range(seconds):
+        try:
+            await announce(seconds - x)
+        except Exception as e:
+            print(f"Countdown message failed: {e}")
+        await asyncio.sleep(max(0, start + x + 1 - time.monotonic()))
+    return await asyncio.shield(task) if task is not None else None
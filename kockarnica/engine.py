@@ -0,0 +1,103 @@
+"""
+Leader election for the game engines.
+
+Every engine process (or web process with GAME_ENGINES["IN_PROCESS"])
+runs `run_engine` for each game. Only the holder of the Redis lease
+engine_leader:<game> runs rounds; it renews the lease every
+RENEW_INTERVAL seconds and stops its game loop as soon as a renewal
+fails. Standbys poll every STANDBY_POLL seconds, so a dead leader is
+replaced within LEASE_TTL + STANDBY_POLL seconds. Lease calls go
+through redis.asyncio, a slow Redis call never stalls the game loops
+that share the event loop with the lease.
+"""
+import asyncio
+import os
+import socket
+import uuid
+
+from django.conf import settings
+
+from .roundstate import get_async_client, run_script
+
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLease:
+    def __init__(self, name, client=None):
+        self._client = client
+        self.key = f"engine_leader:{name}"
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self.ttl_ms = int(settings.GAME_ENGINES["LEASE_TTL"] * 1000)
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_async_client()
+
+    async def acquire(self):
+        return bool(await self.client.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    async def renew(self):
+        return bool(await run_script(RENEW_SCRIPT, [self.key], [self.token, self.ttl_ms], self.client))
+
+    async def release(self):
+        await run_script(RELEASE_SCRIPT, [self.key], [self.token], self.client)
+
+
+async def run_engine(name, game_loop):
+    """Run `game_loop()` whenever this process holds the lease for `name`."""
+    from . import looplag
+    looplag.get_monitor()  # Meri lag event loop-a na kome rade engine-i
+    lease = LeaderLease(name)
+    renew_interval = settings.GAME_ENGINES["RENEW_INTERVAL"]
+    standby_poll = settings.GAME_ENGINES["STANDBY_POLL"]
+    print(f"{name} engine {lease.token} on standby")
+
+    while True:
+        try:
+            acquired = await lease.acquire()
+        except Exception as e:
+            print(f"{name} lease error: {e}")
+            acquired = False
+        if not acquired:
+            await asyncio.sleep(standby_poll)
+            continue
+
+        print(f"{name} engine {lease.token} is the leader")
+        game = asyncio.ensure_future(game_loop())
+        try:
+            while not game.done():
+                await asyncio.sleep(renew_interval)
+                try:
+                    renewed = await lease.renew()
+                except Exception as e:
+                    print(f"{name} lease error: {e}")
+                    renewed = False
+                if not renewed:
+                    print(f"{name} engine lost the lease, stopping")
+                    game.cancel()
+                    break
+        finally:
+            if not game.done():
+                game.cancel()
+            try:
+                await game
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                print(f"{name} game loop crashed: {e}")
+            try:
+                await lease.release()
+            except Exception as e:
+                print(f"{name} lease error: {e}")
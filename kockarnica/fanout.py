@@ -0,0 +1,83 @@
+"""
+Hierarchical fan-out of group broadcasts (BROADCAST["FANOUT"] = "pubsub").
+
+channels_redis delivers a group_send with one Redis operation per member
+channel. In pubsub mode the sender instead does a single
+
+    PUBLISH fanout:<group> <msgpack event>
+
+and every ASGI process runs one subscriber that hands the event to its
+own sockets from an in-memory registry, so the Redis cost of a broadcast
+grows with the number of processes instead of the number of players.
+Pub/sub is at-most-once: a process that loses its subscription misses
+broadcasts until it resubscribes, its sockets catch up on the next
+resync beacon or snapshot.
+"""
+import asyncio
+
+import msgpack
+from django.conf import settings
+
+CHANNEL_PREFIX = "fanout:"
+
+_registry = {}  # group -> set of consumers in this process
+_listener = None
+
+
+async def publish(group, event):
+    from .roundstate import get_async_client
+    await get_async_client().publish(f"{CHANNEL_PREFIX}{group}", msgpack.packb(event))
+
+
+def join(group, consumer):
+    _ensure_listener()
+    _registry.setdefault(group, set()).add(consumer)
+
+
+def leave(group, consumer):
+    members = _registry.get(group)
+    if members is not None:
+        members.discard(consumer)
+        if not members:
+            del _registry[group]
+
+
+def local_count(group):
+    return len(_registry.get(group, ()))
+
+
+def _ensure_listener():
+    global _listener
+    if _listener is None or _listener.done():
+        _listener = asyncio.ensure_future(_listen())
+
+
+async def _deliver(group, event):
+    for consumer in list(_registry.get(group, ())):
+        try:
+            await consumer.send_message(event)
+        except Exception as e:
+            print(f"Fan-out delivery to {consumer} failed: {e}")
+
+
+async def _listen():
+    import redis.asyncio as aioredis
+    while True:
+        client = aioredis.from_url(settings.CACHES["default"]["LOCATION"])
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                group = message["channel"].decode()[len(CHANNEL_PREFIX):]
+                if group in _registry:
+                    await _deliver(group, msgpack.unpackb(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Fan-out subscriber error: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
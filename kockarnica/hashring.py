@@ -0,0 +1,48 @@
+"""
+Consistent hashing of engines (games and crash rooms) to engine processes.
+
+Every node from GAME_ENGINES["NODES"] is placed on the ring
+GAME_ENGINES["VIRTUAL_NODES"] times; an engine belongs to the first node
+clockwise from its own hash. Adding or removing a node only moves the
+engines that hashed next to it. Leader leases still guard every engine,
+so two processes that disagree about the ring never run the same rounds.
+"""
+import bisect
+import hashlib
+
+from django.conf import settings
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes, virtual_nodes=None):
+        if virtual_nodes is None:
+            virtual_nodes = settings.GAME_ENGINES["VIRTUAL_NODES"]
+        points = sorted(
+            (_hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key):
+        if not self._nodes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def engines_for_node(engines, node=None):
+    """
+    The subset of engine names owned by `node`. Without a node or with no
+    NODES configured every engine is returned, the leases pick the leader.
+    """
+    nodes = settings.GAME_ENGINES["NODES"]
+    if node is None or not nodes:
+        return list(engines)
+    ring = HashRing(nodes)
+    return [engine for engine in engines if ring.node_for(engine) == node]
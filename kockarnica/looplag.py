@@ -0,0 +1,90 @@
+"""
+Event loop lag monitor.
+
+A task per event loop sleeps LOOP_LAG["INTERVAL"] seconds and measures
+how late it wakes up. The smoothed lag drives the engines' broadcast
+tick rate: above LOOP_LAG["DEGRADE_THRESHOLD"] ticks are sent
+LOOP_LAG["DEGRADED_TICK_FACTOR"] times less often. Round timing never
+depends on it, engines schedule against the monotonic clock.
+
+Every LOOP_LAG["PUBLISH_INTERVAL"] seconds the lag is written to
+HSET metrics:loop_lag <process> {...} for /api/loop_lag/.
+"""
+import asyncio
+import json
+import time
+
+from django.conf import settings
+
+from .presence import PROCESS_ID, get_client
+from .roundstate import get_async_client
+
+METRICS_KEY = "metrics:loop_lag"
+
+_monitors = {}
+
+
+class LagMonitor:
+    def __init__(self):
+        self.interval = settings.LOOP_LAG["INTERVAL"]
+        self.lag = 0.0  # EWMA u sekundama
+        self.max_lag = 0.0  # Najveci lag od poslednjeg objavljivanja
+        self._published_at = time.monotonic()
+
+    def degraded(self):
+        return self.lag > settings.LOOP_LAG["DEGRADE_THRESHOLD"]
+
+    async def run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - expected)
+            self.lag = 0.8 * self.lag + 0.2 * lag
+            self.max_lag = max(self.max_lag, lag)
+            if time.monotonic() - self._published_at >= settings.LOOP_LAG["PUBLISH_INTERVAL"]:
+                await self.publish()
+
+    async def publish(self):
+        self._published_at = time.monotonic()
+        try:
+            await get_async_client().hset(METRICS_KEY, PROCESS_ID, json.dumps({
+                "lag_ms": round(self.lag * 1000, 2),
+                "max_lag_ms": round(self.max_lag * 1000, 2),
+                "degraded": self.degraded(),
+                "at": time.time(),
+            }))
+        except Exception as e:
+            print(f"Loop lag publish error: {e}")
+        self.max_lag = 0.0
+
+
+def get_monitor():
+    """Monitor of the running event loop, started on first use."""
+    loop = asyncio.get_running_loop()
+    monitor = _monitors.get(loop)
+    if monitor is None:
+        monitor = _monitors[loop] = LagMonitor()
+        loop.create_task(monitor.run())
+    return monitor
+
+
+def tick_factor():
+    """How many times less often the running loop should broadcast ticks."""
+    return settings.LOOP_LAG["DEGRADED_TICK_FACTOR"] if get_monitor().degraded() else 1
+
+
+def published_lag():
+    """{process: metrics} of every process that published recently, stale ones are pruned."""
+    client = get_client()
+    cutoff = time.time() - 3 * settings.LOOP_LAG["PUBLISH_INTERVAL"]
+    metrics = {}
+    stale = []
+    for process, raw in client.hgetall(METRICS_KEY).items():
+        data = json.loads(raw)
+        if data["at"] >= cutoff:
+            metrics[process.decode()] = data
+        else:
+            stale.append(process)
+    if stale:
+        client.hdel(METRICS_KEY, *stale)
+    return metrics
@@ -0,0 +1,99 @@
+"""
+Per-connection outbox with tick conflation.
+
+Channel layer messages are handed to the outbox and the consumer goes
+straight back to reading its channel, so a slow socket never fills its
+channel layer queue. A writer task sends the frames in order:
+
+- events (game_start, cashout, game_end, replies) are never dropped
+  and keep their order; more than OUTBOX["MAX_EVENTS"] waiting events
+  means the client cannot keep up at all and the connection is closed,
+  it gets a fresh snapshot when it reconnects;
+- ticks (running, resync) are conflated, only the latest one waits and
+  a pending tick is discarded when an event overtakes it.
+
+A socket whose pending tick was replaced before it could be sent is
+congested and gets at most one tick per OUTBOX["SLOW_TICK_INTERVAL"]
+seconds until it goes OUTBOX["RECOVER_AFTER"] seconds without losing one.
+"""
+import asyncio
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+class Outbox:
+    def __init__(self, send, on_overflow):
+        self._send = send
+        self._on_overflow = on_overflow
+        self.max_events = settings.OUTBOX["MAX_EVENTS"]
+        self.slow_tick_interval = settings.OUTBOX["SLOW_TICK_INTERVAL"]
+        self.recover_after = settings.OUTBOX["RECOVER_AFTER"]
+        self._events = deque()
+        self._tick = None
+        self._holding = False  # Writer namerno zadrzava tick (usporen klijent)
+        self._last_tick_at = 0
+        self._congested_until = 0
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+        self.overflowed = False
+
+    @property
+    def congested(self):
+        return time.monotonic() < self._congested_until
+
+    def put(self, frame, tick=False):
+        if self.overflowed:
+            return
+        if tick:
+            if self._tick is not None and not self._holding:
+                self._congested_until = time.monotonic() + self.recover_after
+            self._tick = frame
+        else:
+            self._tick = None  # Stari tick ne sme stici posle novijeg dogadjaja
+            self._events.append(frame)
+            if len(self._events) > self.max_events:
+                self.overflowed = True
+                self._events.clear()
+                self._on_overflow()
+                return
+        self._wakeup.set()
+
+    def close(self):
+        self._task.cancel()
+
+    def _tick_delay(self):
+        if not self.congested:
+            return 0
+        return self._last_tick_at + self.slow_tick_interval - time.monotonic()
+
+    async def _run(self):
+        try:
+            while True:
+                if not self._events and self._tick is None:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                if self._events:
+                    await self._send(self._events.popleft())
+                    continue
+
+                delay = self._tick_delay()
+                if delay > 0:
+                    self._holding = True
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._holding = False
+                    continue
+
+                frame, self._tick = self._tick, None
+                if frame is not None:
+                    self._last_tick_at = time.monotonic()
+                    await self._send(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Outbox writer stopped: {e}")
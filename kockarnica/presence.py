@@ -0,0 +1,114 @@
+"""
+Online player counts per game.
+
+Each process counts its own open sockets in memory and publishes them in
+one pipelined heartbeat every PRESENCE["HEARTBEAT_INTERVAL"] seconds (and
+immediately when a count goes from or to zero):
+
+    HSET presence:<game> <process> <count>
+    ZADD presence:heartbeats <process> <now>
+
+A process whose last heartbeat is older than PRESENCE["TTL"] is dead and
+its counts are ignored and pruned, so the heartbeat cost grows with the
+number of processes, not sockets.
+
+Heartbeats and the engines' counts go through redis.asyncio on the
+calling event loop; `online_count` keeps the synchronous client for
+views.
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+
+from django.conf import settings
+
+HEARTBEATS_KEY = "presence:heartbeats"
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_counts = {}
+_heartbeat_task = None
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from django_redis import get_redis_connection
+        _client = get_redis_connection("default")
+    return _client
+
+
+def game_key(game):
+    return f"presence:{game}"
+
+
+async def heartbeat():
+    """Publish this process' counts and prune processes that stopped beating."""
+    from .roundstate import get_async_client
+    client = get_async_client()
+    now = time.time()
+    pipe = client.pipeline(transaction=False)
+    for game, count in _counts.items():
+        pipe.hset(game_key(game), PROCESS_ID, count)
+    pipe.zadd(HEARTBEATS_KEY, {PROCESS_ID: now})
+    pipe.zrangebyscore(HEARTBEATS_KEY, "-inf", now - settings.PRESENCE["TTL"])
+    dead = (await pipe.execute())[-1]
+    if dead:
+        pipe = client.pipeline(transaction=False)
+        pipe.zrem(HEARTBEATS_KEY, *dead)
+        for game in _counts:
+            pipe.hdel(game_key(game), *dead)
+        await pipe.execute()
+
+
+async def heartbeat_forever():
+    while True:
+        await asyncio.sleep(settings.PRESENCE["HEARTBEAT_INTERVAL"])
+        try:
+            await heartbeat()
+        except Exception as e:
+            print(f"Presence heartbeat error: {e}")
+
+
+def _ensure_heartbeat():
+    global _heartbeat_task
+    if _heartbeat_task is None or _heartbeat_task.done():
+        _heartbeat_task = asyncio.ensure_future(heartbeat_forever())
+
+
+async def connected(game):
+    """Count a new socket of `game` in this process."""
+    _ensure_heartbeat()
+    _counts[game] = _counts.get(game, 0) + 1
+    if _counts[game] == 1:
+        await heartbeat()
+
+
+async def disconnected(game):
+    _counts[game] = max(0, _counts.get(game, 0) - 1)
+    if _counts[game] == 0:
+        await heartbeat()
+
+
+def _count_pipeline(pipe, game):
+    pipe.zrangebyscore(HEARTBEATS_KEY, time.time() - settings.PRESENCE["TTL"], "+inf")
+    pipe.hgetall(game_key(game))
+    return pipe
+
+
+def _live_count(alive, counts):
+    alive = set(alive)
+    return sum(int(count) for process, count in counts.items() if process in alive)
+
+
+def online_count(game):
+    """Exact number of open `game` sockets across all live processes."""
+    return _live_count(*_count_pipeline(get_client().pipeline(transaction=False), game).execute())
+
+
+async def aonline_count(game):
+    """online_count for the event loop, over the loop's redis.asyncio client."""
+    from .roundstate import get_async_client
+    return _live_count(*await _count_pipeline(get_async_client().pipeline(transaction=False), game).execute())
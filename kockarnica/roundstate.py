@@ -0,0 +1,400 @@
+"""
+Round state shared by every ASGI worker and the engine process.
+
+The engine that owns a game (a crash room or roulette) keeps its current
+round in Redis instead of consumer class attributes, so a socket on any
+worker sees the same round:
+
+    round:<engine>          HASH round_id, phase, hashed_seed, started_at,
+                            manual_out / manual_paid (stake cashed out
+                            manually and what it was paid), cap (max win
+                            multiplier, no cashout pays above it), ...
+    round:<engine>:bets     HASH bet id -> JSON bet (user id and slot for
+                            crash, user id and position for roulette)
+    round:<engine>:exposure HASH outcome -> what the house pays if it hits
+    round:<engine>:queue    LIST of JSON bets waiting for the next round
+    round:<engine>:results  LIST of the last ROUND_STATE["RESULTS"] results
+    round:<engine>:snapshot connect snapshot, already serialized as JSON
+                            (and as MessagePack under :snapshot:msgpack)
+
+Phases go betting -> running -> ended. Bets are only added to the bet
+book while the round is betting and cashouts only succeed while it is
+running; both checks happen inside Lua scripts, so they are atomic with
+the engine's phase changes. Consumers read the round record with one
+HGETALL and cache it for ROUND_STATE["CACHE_TTL"] seconds.
+
+Opening and ending a round are scripts fenced on round_id: an engine
+only opens a round over the one it knows about and only ends its own,
+so an engine that lost its lease cannot clobber the new leader's round.
+A round is never opened over a running one; a new leader that finds
+its game running plays that round to the end from the stored bet book.
+
+Bet and cashout scripts bump the round's version. The engine rebuilds
+the snapshot on every phase change and when the version moved, so a
+connecting socket costs one cached GET instead of several queries.
+
+Every call goes through redis.asyncio, the consumers and the engine tick
+path never block the event loop on Redis.
+"""
+import asyncio
+import json
+import time
+
+import msgpack
+from django.conf import settings
+
+BETTING = "betting"
+RUNNING = "running"
+ENDED = "ended"
+
+ACCEPTED = 1
+CLOSED = 0
+DUPLICATE = -1
+
+# KEYS = round, bets, exposure. ARGV = previous round_id ('' before the
+# first round), round_id, then field, value pairs. Opens betting with an
+# empty bet book only if the current round is still `previous` and is not
+# running (its pending bets are settled by whoever leads it).
+OPEN_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'phase') == 'running'
+    or (redis.call('HGET', KEYS[1], 'round_id') or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+redis.call('HSET', KEYS[1], 'round_id', ARGV[2], 'phase', 'betting')
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# KEYS = round. ARGV = round_id, then field, value pairs.
+# Ends the round only if it is still `round_id`.
+END_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'round_id') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'phase', 'ended')
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# KEYS = round. ARGV = round_id, then field, value pairs.
+# Sets fields of the round only if it is still `round_id`.
+UPDATE_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'round_id') ~= ARGV[1] then
+    return 0
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# KEYS = round, bets. ARGV = round_id, then bet id, bet JSON pairs.
+# Returns ACCEPTED, CLOSED or DUPLICATE per bet.
+ADD_BETS_SCRIPT = """
+local result = {}
+local open = redis.call('HGET', KEYS[1], 'phase') == 'betting'
+    and redis.call('HGET', KEYS[1], 'round_id') == ARGV[1]
+for i = 2, #ARGV, 2 do
+    if not open then
+        result[#result + 1] = 0
+    elseif redis.call('HSETNX', KEYS[2], ARGV[i], ARGV[i + 1]) == 1 then
+        redis.call('HINCRBY', KEYS[1], 'version', 1)
+        result[#result + 1] = 1
+    else
+        result[#result + 1] = -1
+    end
+end
+return result
+"""
+
+# KEYS = round, bets. ARGV = round_id, then bet ids. Takes bets back out
+# of a round that is still betting, returns 1 per removed bet and 0 if it
+# stays (the round started, the engine already settles it).
+REMOVE_BETS_SCRIPT = """
+local result = {}
+local open = redis.call('HGET', KEYS[1], 'phase') == 'betting'
+    and redis.call('HGET', KEYS[1], 'round_id') == ARGV[1]
+for i = 2, #ARGV do
+    if open and redis.call('HDEL', KEYS[2], ARGV[i]) == 1 then
+        redis.call('HINCRBY', KEYS[1], 'version', 1)
+        result[#result + 1] = 1
+    else
+        result[#result + 1] = 0
+    end
+end
+return result
+"""
+
+# KEYS = round, bets. ARGV = round_id, then field, value pairs.
+# Moves a betting round to running and returns its bet book, or false.
+START_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'phase') ~= 'betting'
+    or redis.call('HGET', KEYS[1], 'round_id') ~= ARGV[1] then
+    return false
+end
+redis.call('HSET', KEYS[1], 'phase', 'running')
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# KEYS = round, bets. ARGV = round_id, manual (0/1), then user_id, multiplier pairs.
+# Marks bets cashed out at `multiplier`, never above the round's cap, and
+# returns {bet amount, multiplier paid} per pair, or "closed" (round not
+# running or already crashed), "missing" (no bet or already cashed out),
+# "auto" (manual cashout of an auto cashout bet).
+CASHOUT_SCRIPT = """
+local result = {}
+local running = redis.call('HGET', KEYS[1], 'phase') == 'running'
+    and redis.call('HGET', KEYS[1], 'round_id') == ARGV[1]
+local crash_point = tonumber(redis.call('HGET', KEYS[1], 'crash_point'))
+local cap = tonumber(redis.call('HGET', KEYS[1], 'cap'))
+for i = 3, #ARGV, 2 do
+    local raw = redis.call('HGET', KEYS[2], ARGV[i])
+    local multiplier = tonumber(ARGV[i + 1])
+    if not running or (crash_point and multiplier >= crash_point) then
+        result[#result + 1] = 'closed'
+    elseif not raw then
+        result[#result + 1] = 'missing'
+    else
+        local bet = cjson.decode(raw)
+        if bet['cashed_out'] ~= 0 then
+            result[#result + 1] = 'missing'
+        elseif ARGV[2] == '1' and bet['auto_cashout'] ~= 0 then
+            result[#result + 1] = 'auto'
+        else
+            if cap and multiplier > cap then
+                multiplier = cap
+            end
+            bet['cashed_out'] = multiplier
+            redis.call('HSET', KEYS[2], ARGV[i], cjson.encode(bet))
+            redis.call('HINCRBY', KEYS[1], 'version', 1)
+            if ARGV[2] == '1' then
+                redis.call('HINCRBYFLOAT', KEYS[1], 'manual_out', bet['bet_amount'])
+                redis.call('HINCRBYFLOAT', KEYS[1], 'manual_paid', bet['bet_amount'] * multiplier)
+            end
+            result[#result + 1] = {tostring(bet['bet_amount']), tostring(multiplier)}
+        end
+    end
+end
+return result
+"""
+
+
+# Fields of the round record that are safe to show to players
+PUBLIC_FIELDS = {"round_id": int, "phase": str, "hashed_seed": str, "started_at": int, "r": float}
+
+
+class AlreadyJoined(Exception):
+    pass
+
+
+class StaleRound(Exception):
+    """The round in Redis is not the one this engine expected, another engine owns it."""
+
+
+_clients = {}
+
+
+def get_async_client():
+    """redis.asyncio client of the running event loop, its connections are bound to the loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        import redis.asyncio as aioredis
+        client = _clients[loop] = aioredis.from_url(settings.CACHES["default"]["LOCATION"])
+    return client
+
+
+_scripts = {}
+
+
+async def run_script(script, keys, args, client=None):
+    """Run a Lua script on `client` (the running loop's client by default), registered once per script."""
+    if client is None:
+        client = get_async_client()
+    if script not in _scripts:
+        _scripts[script] = client.register_script(script)
+    return await _scripts[script](keys=keys, args=args, client=client)
+
+
+def _args(*head, fields):
+    args = list(head)
+    for field, value in fields.items():
+        args += [field, value]
+    return args
+
+
+class RoundState:
+    def __init__(self, name, client=None):
+        self._client = client
+        self.key = f"round:{name}"
+        self.bets_key = f"round:{name}:bets"
+        self.queue_key = f"round:{name}:queue"
+        self.results_key = f"round:{name}:results"
+        self.snapshot_key = f"round:{name}:snapshot"
+        self.exposure_key = f"round:{name}:exposure"
+        self.cache_ttl = settings.ROUND_STATE["CACHE_TTL"]
+        self.max_results = settings.ROUND_STATE["RESULTS"]
+        self._cached = None
+        self._cached_at = 0
+        self._snapshots = {}  # binary -> (frame, read_at)
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_async_client()
+
+    async def _run(self, script, keys, args):
+        return await run_script(script, keys, args, self.client)
+
+    async def read(self, fresh=False):
+        """Round record as a dict of strings ({} before the first round)."""
+        now = time.monotonic()
+        if fresh or self._cached is None or now - self._cached_at > self.cache_ttl:
+            self._cached = {
+                field.decode(): value.decode()
+                for field, value in (await self.client.hgetall(self.key)).items()
+            }
+            self._cached_at = now
+        return self._cached
+
+    async def snapshot(self, binary=False):
+        """
+        Serialized snapshot of the current round, JSON text or MessagePack
+        bytes if `binary`. None before the first round.
+        """
+        now = time.monotonic()
+        frame, read_at = self._snapshots.get(binary, (None, None))
+        if read_at is None or now - read_at > self.cache_ttl:
+            frame = await self.client.get(f"{self.snapshot_key}:msgpack" if binary else self.snapshot_key)
+            if frame is not None and not binary:
+                frame = frame.decode()
+            self._snapshots[binary] = (frame, now)
+        return frame
+
+    # Engine
+
+    async def open(self, round_id, previous, **fields):
+        """
+        Start taking bets for `round_id` with an empty bet book, replacing
+        round `previous` (None before the first round). Raises StaleRound
+        if the current round is another one or is still running.
+        """
+        args = _args("" if previous is None else previous, round_id, fields=fields)
+        if not await self._run(OPEN_SCRIPT, [self.key, self.bets_key, self.exposure_key], args):
+            raise StaleRound(f"Round {self.key} moved past {previous} or is running")
+
+    async def start(self, round_id, **fields):
+        """Close betting and return the bet book {bet id: bet}, None if the round is not betting."""
+        book = await self._run(START_SCRIPT, [self.key, self.bets_key], _args(round_id, fields=fields))
+        if book is None:
+            return None
+        return {book[i].decode(): json.loads(book[i + 1]) for i in range(0, len(book), 2)}
+
+    async def end(self, round_id, **fields):
+        """End `round_id`, False if the current round is another one."""
+        return bool(await self._run(END_SCRIPT, [self.key], _args(round_id, fields=fields)))
+
+    async def update(self, round_id, **fields):
+        """Set fields of `round_id`, False if the current round is another one."""
+        return bool(await self._run(UPDATE_SCRIPT, [self.key], _args(round_id, fields=fields)))
+
+    async def bets(self):
+        """Bet book of the current round {bet id: bet}."""
+        return {field.decode(): json.loads(bet) for field, bet in (await self.client.hgetall(self.bets_key)).items()}
+
+    async def version(self):
+        return (await self.read(fresh=True)).get("version")
+
+    async def add_result(self, result):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lpush(self.results_key, json.dumps(result))
+        pipe.ltrim(self.results_key, 0, self.max_results - 1)
+        await pipe.execute()
+
+    async def publish_snapshot(self, **fields):
+        """
+        Serialize the public round record, bet book and last results once
+        (plus `fields`) for every connecting socket. Returns the round
+        version the snapshot was built from.
+        """
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hgetall(self.key)
+        pipe.hgetall(self.bets_key)
+        pipe.lrange(self.results_key, 0, -1)
+        record, bets, results = await pipe.execute()
+        record = {field.decode(): value.decode() for field, value in record.items()}
+        message = {"status": "snapshot"}
+        for field, cast in PUBLIC_FIELDS.items():
+            if record.get(field):
+                message[field] = cast(record[field])
+        message.update(fields)
+        message["bets"] = [json.loads(bet) for bet in bets.values()]
+        message["results"] = [json.loads(result) for result in results]
+        snapshots = {self.snapshot_key: json.dumps(message)}
+        if settings.BROADCAST["MSGPACK"]:
+            snapshots[f"{self.snapshot_key}:msgpack"] = msgpack.packb(message)
+        await self.client.mset(snapshots)
+        return record.get("version")
+
+    async def drain_queue(self):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(self.queue_key, 0, -1)
+        pipe.delete(self.queue_key)
+        queued, _ = await pipe.execute()
+        return [json.loads(bet) for bet in queued]
+
+    # Consumers and engine
+
+    async def add_bets(self, round_id, bets):
+        """Add [(bet id, bet dict)] to the bet book, returns ACCEPTED, CLOSED or DUPLICATE per bet."""
+        if not bets:
+            return []
+        args = [round_id]
+        for bet_id, bet in bets:
+            args += [bet_id, json.dumps(bet)]
+        return await self._run(ADD_BETS_SCRIPT, [self.key, self.bets_key], args)
+
+    async def remove_bets(self, round_id, bet_ids):
+        """Take [bet id] back out of a betting round, returns a bool per bet (False if it stays in the round)."""
+        if not bet_ids:
+            return []
+        return [bool(removed) for removed in await self._run(REMOVE_BETS_SCRIPT, [self.key, self.bets_key], [round_id, *bet_ids])]
+
+    async def add_exposure(self, increments):
+        """Grow the round's exposure by {outcome: amount} in one pipeline."""
+        pipe = self.client.pipeline(transaction=False)
+        for outcome, amount in increments.items():
+            pipe.hincrbyfloat(self.exposure_key, outcome, amount)
+        await pipe.execute()
+
+    async def exposure(self):
+        return {int(outcome): float(amount) for outcome, amount in (await self.client.hgetall(self.exposure_key)).items()}
+
+    async def queue(self, bet):
+        await self.client.rpush(self.queue_key, json.dumps(bet))
+
+    async def cashout(self, round_id, cashouts, manual):
+        """
+        Cash out [(bet id, multiplier)] of a running round, at most at the
+        round's cap. Returns (bet amount, multiplier paid) per cashout, or
+        "closed", "missing" or "auto" if it was refused.
+        """
+        if not cashouts:
+            return []
+        args = [round_id, int(manual)]
+        for bet_id, multiplier in cashouts:
+            args += [bet_id, multiplier]
+        results = []
+        for result in await self._run(CASHOUT_SCRIPT, [self.key, self.bets_key], args):
+            if isinstance(result, bytes):
+                results.append(result.decode())
+            else:
+                results.append((float(result[0]), float(result[1])))
+        return results
@@ -0,0 +1,89 @@
+"""
+Reverse SHA-256 hash chain of server seeds (bustabit style).
+
+The chain file holds N raw 32 byte records. Record N-1 is random, every
+other record is the hash of the one after it:
+
+    chain[i] = sha256(chain[i + 1].hex())
+
+Round i is played with chain[i].hex() as its server seed, so the hashed
+seed of a round is the seed of the round before it, and hashing any
+revealed seed forward i + 1 times gives the published terminating hash
+sha256(chain[0].hex()).
+"""
+import hashlib
+import mmap
+import os
+import secrets
+
+from django.conf import settings
+
+RECORD_SIZE = 32
+
+
+def next_hash(seed):
+    return hashlib.sha256(seed.encode()).hexdigest()
+
+
+def chain_path(game):
+    return os.path.join(settings.SEED_CHAIN["DIR"], f"{game}.chain")
+
+
+def generate_chain(path, length):
+    """Write a chain of `length` seeds to `path` and return its terminating hash."""
+    with open(path, "wb") as f:
+        f.truncate(length * RECORD_SIZE)
+    with open(path, "r+b") as f:
+        with mmap.mmap(f.fileno(), 0) as mm:
+            seed = secrets.token_bytes(RECORD_SIZE)
+            for index in range(length - 1, -1, -1):
+                mm[index * RECORD_SIZE:(index + 1) * RECORD_SIZE] = seed
+                seed = hashlib.sha256(seed.hex().encode()).digest()
+            mm.flush()
+    return seed.hex()
+
+
+def verify_seed(server_seed, index, terminating_hash):
+    """Hash a revealed seed forward index + 1 times and compare with the published hash."""
+    seed = server_seed
+    for _ in range(index + 1):
+        seed = next_hash(seed)
+    return seed == terminating_hash
+
+
+class SeedChain:
+    """Read-only, memory-mapped view of a chain file indexed by round number."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.length = len(self._mmap) // RECORD_SIZE
+        self.terminating_hash = next_hash(self.seed(0))
+        self.cursor = None  # Engine ga postavlja iz baze pri prvoj rundi
+
+    def seed(self, index):
+        if not 0 <= index < self.length:
+            raise IndexError(f"Seed chain exhausted at round {index}")
+        return self._mmap[index * RECORD_SIZE:(index + 1) * RECORD_SIZE].hex()
+
+    def pop(self):
+        """Return (index, seed) of the next unused round."""
+        index = self.cursor
+        seed = self.seed(index)
+        self.cursor += 1
+        return index, seed
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+_chains = {}
+
+
+def get_chain(game):
+    """Chain for `game` ("crash", "crash-<room>" or "roulette"), or None if it was never generated."""
+    if game not in _chains:
+        path = chain_path(game)
+        _chains[game] = SeedChain(path) if os.path.exists(path) else None
+    return _chains[game]
@@ -29,6 +29,102 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 JWT_SETTINGS = {
     "ACCESS_TOKEN_LIFETIME" : datetime.timedelta(days=1),
     "ALGORITHM" : "HS256",
+    # Kes verifikovanih tokena (users/tokencache.py)
+    "VERIFIED_CACHE_SIZE" : 10_000,
+    "VERIFIED_CACHE_TTL" : 60,
+}
+
+#Crash
+CRASH_SETTINGS = {
+    # True = stari protokol, multiplier se salje svakih time_step sekundi.
+    # False = samo game_start sa started_at i r, resync beacon i game_end.
+    "TICK_BROADCAST" : True,
+    "RESYNC_INTERVAL" : 1.0,
+    # /api/verify_games/: max rund po zahtevu i od koliko rundi se koristi process pool
+    "VERIFY_BATCH_LIMIT" : 100_000,
+    "VERIFY_POOL_THRESHOLD" : 5_000,
+}
+
+#Crash sobe (ws/crash/<room>/), svaka ima svoju grupu, runde i limite uloga.
+#"default" je i ws/crash/ bez imena sobe.
+# MAX_WIN: najveca ukupna isplata runde, kad je exposure dostigne svi preostali se isplacuju (None = bez limita)
+CRASH_ROOMS = {
+    "default" : {"MIN_BET" : 0.1, "MAX_BET" : 1_000, "MAX_WIN" : 500_000},
+    "low" : {"MIN_BET" : 0.1, "MAX_BET" : 10, "MAX_WIN" : 50_000},
+    "high" : {"MIN_BET" : 10, "MAX_BET" : 100_000, "MAX_WIN" : 5_000_000},
+}
+
+#Provably fair seed chain, generated with `manage.py generate_seed_chain <game>`
+SEED_CHAIN = {
+    "DIR" : BASE_DIR / "seedchains",
+    "LENGTH" : 10_000_000,
+}
+
+#Balansi: "redis" (drze se u Redis-u i periodicno upisuju u users.User.balance)
+#ili "database" (jedan uslovni UPDATE po uplati/isplati)
+BALANCES = {
+    "BACKEND" : "redis",
+    "FLUSH_INTERVAL" : 1.0,
+}
+
+#Opklade se skupljaju i upisuju u bazu u grupama (bulk_create + bulk debit)
+BET_INTAKE = {
+    "MAX_BATCH" : 200,
+    "MAX_DELAY" : 0.005,
+}
+
+#Game engine-i. IN_PROCESS = True pokrece ih u web procesu (runserver),
+#inace rade u posebnom procesu: `manage.py run_game_engines`.
+#Samo vlasnik Redis lease-a (LEASE_TTL sekundi) vodi runde jedne igre.
+GAME_ENGINES = {
+    "IN_PROCESS" : True,
+    "LEASE_TTL" : 0.8,
+    "RENEW_INTERVAL" : 0.25,
+    "STANDBY_POLL" : 0.1,
+    # Imena engine procesa (run_game_engines --node). Igre i crash sobe se
+    # rasporedjuju po njima konzistentnim hesiranjem (kockarnica/hashring.py).
+    "NODES" : [],
+    "VIRTUAL_NODES" : 64,
+}
+
+#Stanje runde (faza, start, hash seed-a, bet book) je u Redisu da bi svaki
+#worker video istu rundu (kockarnica/roundstate.py). Consumeri ga kesiraju CACHE_TTL sekundi.
+#RESULTS = koliko poslednjih rezultata ide u snapshot pri konekciji.
+ROUND_STATE = {
+    "CACHE_TTL" : 0.05,
+    "RESULTS" : 20,
+}
+
+#Poruke grupi se serijalizuju jednom (kockarnica/broadcast.py). MSGPACK = True
+#ih kodira i kao MessagePack za klijente koji traze "msgpack" subprotocol.
+#FANOUT = "group" salje preko channel layer grupa (Redis operacija po konekciji),
+#"pubsub" jedan PUBLISH po poruci, svaki proces isporucuje svojim socketima.
+BROADCAST = {
+    "MSGPACK" : True,
+    "FANOUT" : "pubsub",
+}
+
+#Outbox po konekciji (kockarnica/outbox.py): najvise MAX_EVENTS poruka na cekanju,
+#sporim klijentima tick najvise svakih SLOW_TICK_INTERVAL sekundi.
+OUTBOX = {
+    "MAX_EVENTS" : 256,
+    "SLOW_TICK_INTERVAL" : 0.25,
+    "RECOVER_AFTER" : 5,
+}
+
+#Merenje laga event loop-a (kockarnica/looplag.py). Iznad DEGRADE_THRESHOLD sekundi
+#engine salje tick-ove DEGRADED_TICK_FACTOR puta redje, tajming runde ostaje tacan.
+LOOP_LAG = {
+    "INTERVAL" : 0.1,
+    "DEGRADE_THRESHOLD" : 0.02,
+    "DEGRADED_TICK_FACTOR" : 4,
+    "PUBLISH_INTERVAL" : 5,
+}
+
+#Broj konekcija po igri, svaki proces salje jedan heartbeat (kockarnica/presence.py)
+PRESENCE = {
+    "HEARTBEAT_INTERVAL" : 5,
+    "TTL" : 15,
 }
 
 AUTH_USER_MODEL = "users.User"
@@ -61,6 +157,10 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "users.authentication.JWTAuthentication",
     ],
+    # /api/verify_games/ moze da pokrene do VERIFY_BATCH_LIMIT rundi u process pool-u
+    "DEFAULT_THROTTLE_RATES": {
+        "verify_games": "10/min",
+    },
 }
 
 AUTHENTICATION_BACKENDS = [
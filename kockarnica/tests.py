@@ -0,0 +1,46 @@
+import hashlib
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from .seedchain import SeedChain, generate_chain, next_hash, verify_seed
+
+
+class SeedChainTests(SimpleTestCase):
+    length = 50
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.dir.name, "test.chain")
+        self.terminating_hash = generate_chain(path, self.length)
+        self.chain = SeedChain(path)
+
+    def tearDown(self):
+        self.chain.close()
+        self.dir.cleanup()
+
+    def test_chain_links(self):
+        self.assertEqual(self.chain.length, self.length)
+        # Hash seed-a runde je seed prethodne runde
+        for index in range(self.length - 1):
+            self.assertEqual(next_hash(self.chain.seed(index + 1)), self.chain.seed(index))
+        self.assertEqual(self.chain.terminating_hash, self.terminating_hash)
+        self.assertEqual(self.terminating_hash, hashlib.sha256(self.chain.seed(0).encode()).hexdigest())
+
+    def test_verify_seed(self):
+        for index in (0, 1, self.length // 2, self.length - 1):
+            self.assertTrue(verify_seed(self.chain.seed(index), index, self.terminating_hash))
+
+    def test_verify_seed_rejects_wrong_index_or_seed(self):
+        seed = self.chain.seed(10)
+        self.assertFalse(verify_seed(seed, 9, self.terminating_hash))
+        self.assertFalse(verify_seed(seed, 11, self.terminating_hash))
+        self.assertFalse(verify_seed(next_hash(seed), 10, self.terminating_hash))
+
+    def test_pop_and_exhaustion(self):
+        self.chain.cursor = self.length - 2
+        self.assertEqual(self.chain.pop(), (self.length - 2, self.chain.seed(self.length - 2)))
+        self.assertEqual(self.chain.pop()[0], self.length - 1)
+        with self.assertRaises(IndexError):
+            self.chain.pop()
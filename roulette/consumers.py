@@ -1,154 +1,129 @@
 import asyncio
-import json
 import hashlib
 import secrets
-from django.core.cache import cache
+import time
+from functools import partial
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.layers import get_channel_layer
-import random as rnd
-import jwt
-from django.conf import settings
+from channels.exceptions import ChannelFull
 from channels.db import database_sync_to_async
-from urllib.parse import parse_qs
-
-waiting_queue = []
-
-class RouletteConsumer(AsyncWebsocketConsumer):
-    server_seed = None
+from kockarnica import broadcast, presence
+from kockarnica.broadcast import BroadcastConsumerMixin
+from kockarnica.seedchain import get_chain, next_hash
+from kockarnica.betintake import BetBatcher
+from kockarnica.countdown import countdown
+from kockarnica.roundstate import ACCEPTED, BETTING, DUPLICATE, RUNNING, AlreadyJoined, RoundState, StaleRound
+from users.balances import InsufficientFunds, get_balances
+from .gamemechanics import BET_KINDS, BetArrays, exposure, outcome_for, position_key
+
+class RouletteConsumer(BroadcastConsumerMixin, AsyncWebsocketConsumer):
     client_seed = "default_client_seed"
-    nonce = 0
-    hash_server_seed = None
-    outcome = None
     channel_layer = None
-    active_users = {}
     current_game = None
-    connected = False
+    next_game = None  # Runda pripremljena tokom odbrojavanja
+    bet_intake = None
+    state = None  # RoundState, deljeno stanje runde za sve workere
+    engine_channel = "roulette.engine"  # Kontrolni kanal koji budi engine
     game_running = False
     user = None
 
-    @database_sync_to_async
-    def get_game(self, game_id = None):
-        from .models import RouletteGame
-        return RouletteGame.objects.get(id=game_id) if game_id else RouletteGame.objects.order_by("-id").first()
-
-    @database_sync_to_async
-    def get_user(self, user_id):
-        from users.models import User
-        return User.objects.get(id=user_id)
-    
-    async def get_user_from_token(self, query_string):
-        try:
-
-            params = dict(q.split("=") for q in query_string.decode().split("&"))
-            token = params.get("token", None)
-            
-            if not token:
-                print("Token not found in query string")
-                return
-
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-
-            if not payload:
-                return
-            
-            user_id = payload.get("id", None)
-            if user_id is None:
-                print("User ID not found in token payload.")
-                return None
-            
-            from asgiref.sync import sync_to_async
-            from users.models import User
-
-            user = await sync_to_async(User.objects.get)(id=user_id)
-            print(f"User found: {user}")
-            return user
-        except jwt.ExpiredSignatureError:
-            print("Token has expired")
-            return
-        except jwt.InvalidTokenError:
-            print("Invalid token")
-        except Exception as e:
-            print(f"Desila se greska {e}")
-            return
-
-    async def keep_alive(self):
-        while True:
-            try:
-
-                cache.set("websocket_connected", True, timeout=40)
-                await asyncio.sleep(20)
-
-            except Exception as e:
-                print(f"Ping error: {e}")
-                break
-
+    @classmethod
+    def round_state(cls):
+        if cls.state is None:
+            cls.state = RoundState("roulette")
+        return cls.state
     
-
     async def connect(self):
-        await self.accept()
-        print("Websocket connection with roulette established.")
-
-        if self.active_users is None:
-            self.active_users = {}
-
-        self.user = await self.get_user_from_token(self.scope["query_string"])
-        if not self.user:
-            await self.send(json.dumps({"error" : "Authentication failed"}))
+        # JWTAuthMiddleware vec odbija konekcije bez validnog tokena
+        self.user = self.scope.get("user")
+        if self.user is None or not self.user.is_authenticated:
             await self.close()
             return
 
-        await self.channel_layer.group_add("roulette_game", self.channel_name)
+        await self.accept(self.negotiate_subprotocol())
+        self.open_outbox()
+        print("Websocket connection with roulette established.")
+
+        await self.join_group("roulette_game")
         print("User added to roulette group")
 
-        await self.send(json.dumps({"status": "connected"}))
-        cache.set("roulette_websocket_connected", True)
+        await self.send_event({"status": "connected"})
+        await presence.connected("roulette")
+        self.counted = True
+        await self.wake_engine()
 
-        if self.game_running:
-            await self.send(json.dumps({"hashed_server_seed": f"{self.hash_server_seed}"}))
+        # Jedna vec serijalizovana poruka sa fazom, opkladama i poslednjim rezultatima
+        snapshot = await self.round_state().snapshot(self.binary)
+        if snapshot is not None:
+            await self.send_frame(snapshot)
     
+    async def wake_engine(self):
+        try:
+            await self.channel_layer.send(self.engine_channel, {"type": "players.present"})
+        except ChannelFull:
+            pass  # Engine vec ima neprocitane poruke za budjenje
+
     async def disconnect(self, code):
-        cache.set("roulette_websocket_connected", False)
-        await self.channel_layer.group_discard("roulette_game", self.channel_name)
+        self.close_outbox()
+        if getattr(self, "counted", False):
+            await presence.disconnected("roulette")
+            self.counted = False
+        await self.leave_group("roulette_game")
         print(f"User disconnected from roulette_game group (code {code})")
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         if self.user.is_authenticated:
-            data = json.loads(text_data)
+            data = self.decode_frame(text_data, bytes_data)
             data["user_id"] = self.user.id
-            data["balance"] = self.user.balance
             action = data.get("action")
 
             if action == "join":
                 user_id = data.get("user_id")
                 bet_amount = data.get("bet_amount")
-                type = data.get("type").lower()
-                user = await self.get_user(user_id)
+                type = position_key(str(data.get("type", "")).lower(), data.get("numbers"), data.get("index"))
+                if type is None:
+                    await self.send_event({
+                        "status" : "error",
+                        "message" : f"Unknown bet. Choose one of: {', '.join(BET_KINDS)} (inside bets need numbers, dozen and column an index 1-3)."
+                    })
+                    return
                 if bet_amount < 0.1:
-                    await self.send(json.dumps({
+                    await self.send_event({
                         "status" : "error",
                         "message" : "Bet must be greater than 0.1!"
-                    }))
+                    })
                     return
-                if bet_amount > user.balance:
-                    await self.send(json.dumps({
+                try:
+                    game_user = await self.add_user_to_game(user_id, bet_amount,type)
+                except InsufficientFunds:
+                    await self.send_event({
                         "status" : "error",
                         "message" : "Insufficient funds."
-                    }))
+                    })
+                    return
+                except AlreadyJoined:
+                    await self.send_event({
+                        "status" : "error",
+                        "message" : f"You already have a bet on {type} in this round."
+                    })
+                    return
+                if game_user is None:
+                    await self.send_event({
+                        "status" : "in_queue",
+                        "message" : "Game is running. You are in queue."
+                    })
                     return
-                game_user = await self.add_user_to_game(user_id, bet_amount,type)
+
+                await self.send_event({
+                    "status" : "joined",
+                    "message" : f"User {user_id} joined the game with {bet_amount} bet on {type}."
+                })
 
 
 
     @classmethod
     async def add_user_to_game(cls, user_id, bet_amount,type):
-        from asgiref.sync import sync_to_async
-        from users.models import User
-        from .models import RouletteGameUser
-        game = await cls.get_game()
-        user = await sync_to_async(User.objects.get)(id=user_id)
-
-        if game.game_running:
-            waiting_queue.append(
+        if (await cls.round_state().read()).get("phase") != BETTING:
+            await cls.round_state().queue(
                 {
                     "user_id": user_id,
                     "bet_amount": bet_amount,
@@ -157,43 +132,98 @@ class RouletteConsumer(AsyncWebsocketConsumer):
             )
             print(f"User {user_id} added to waiting queue")
             return None
-        game_user = await sync_to_async(RouletteGameUser.objects.create)(
-            game=game,
-            user=user,
-            bet_amount=bet_amount
-        )
 
-        cls.active_users[user_id] = {
-            "bet_amount" : bet_amount,
-            "type" : type,
-        }
-        print(f"User {user_id} joined game {game.id} with bet amount {bet_amount}")
-        await cls.take_money(user_id)
+        if cls.bet_intake is None:
+            cls.bet_intake = BetBatcher(cls.commit_bets)
+        game_user = await cls.bet_intake.submit((user_id, bet_amount, type))
+        if game_user is not None:
+            print(f"User {user_id} joined game {game_user.game_id} with bet amount {bet_amount}")
         return game_user
-    
-    @classmethod
-    async def take_money(cls, user_id):
-        from users.models import User
-        from asgiref.sync import sync_to_async
 
-        user = await sync_to_async(User.objects.get)(id=user_id)
-        
-        bet_amount = cls.active_users.get(user_id, {}).get("bet_amount", 0)
+    @classmethod
+    @database_sync_to_async
+    def create_game_users(cls, game_id, bets):
+        from django.db import transaction
+        from .models import RouletteGameUser
+        with transaction.atomic():
+            return RouletteGameUser.objects.bulk_create([
+                RouletteGameUser(game_id=game_id, user_id=user_id, bet_amount=bet_amount, bet_type=type)
+                for user_id, bet_amount, type in bets
+            ])
 
-        if bet_amount > 0:
-            user.balance -= bet_amount
-            await sync_to_async(user.save)() 
-            print(f"Oduzet novac: {bet_amount}. Novi balans: {user.balance}")
-         
     @classmethod
-    async def give_money(cls, user_id, amount):
-        from users.models import User
-        from asgiref.sync import sync_to_async
-        user = await sync_to_async(User.objects.get)(id=user_id)
-        print(amount)
-        user.balance += amount
-        await sync_to_async(user.save)()
-        print(f"Novi balans: {user.balance}")
+    async def commit_bets(cls, bets):
+        """
+        Commit a batch of (user_id, bet_amount, position key) joins with one
+        bulk debit, one bet book script and one bulk_create, and grow the
+        round's exposure by the accepted bets. A user can hold many bets but
+        one per position. Returns per bet, in order, a RouletteGameUser, None
+        if betting closed meanwhile (the bet is queued for the next round) or
+        an InsufficientFunds/AlreadyJoined error.
+        """
+        if not bets:
+            return []
+        state = cls.round_state()
+        round_id = (await state.read(fresh=True)).get("round_id")
+        balances = get_balances()
+        accepted = await balances.debit_many([(user_id, bet_amount) for user_id, bet_amount, _ in bets])
+        debited = [i for i, ok in enumerate(accepted) if ok]
+        statuses = {}
+        exposed = False
+        # Sve posle skidanja novca je u refund putanji, i greska Redis-a vraca uloge
+        try:
+            statuses = dict(zip(debited, await state.add_bets(round_id, [
+                (f"{bets[i][0]}:{bets[i][2]}", {"user_id": bets[i][0], "bet_amount": bets[i][1], "type": bets[i][2]})
+                for i in debited
+            ]))) if round_id is not None else {}
+            joined = [bets[i] for i in debited if statuses.get(i) == ACCEPTED]
+            if joined:
+                payouts = exposure([(type, bet_amount) for _, bet_amount, type in joined])
+                await state.add_exposure({number: float(amount) for number, amount in enumerate(payouts) if amount})
+                exposed = True
+            game_users = iter(await cls.create_game_users(int(round_id), joined) if joined else [])
+        except Exception:
+            # Prihvacene opklade se vade iz bet book-a; koje ostanu (runda je krenula) igraju i ne vracaju se
+            in_book = [i for i in debited if statuses.get(i) == ACCEPTED]
+            try:
+                removed = await state.remove_bets(round_id, [f"{bets[i][0]}:{bets[i][2]}" for i in in_book])
+            except Exception as e:
+                print(f"Cannot take bets back out of the round: {e}")
+                removed = [False] * len(in_book)
+            taken_out = [bets[i] for i, ok in zip(in_book, removed) if ok]
+            if exposed and taken_out:
+                payouts = exposure([(type, bet_amount) for _, bet_amount, type in taken_out])
+                try:
+                    await state.add_exposure({number: -float(amount) for number, amount in enumerate(payouts) if amount})
+                except Exception as e:
+                    print(f"Cannot roll back the round's exposure: {e}")
+            live = {i for i, ok in zip(in_book, removed) if not ok}
+            refunds = {}
+            for i in debited:
+                if i not in live:
+                    refunds[bets[i][0]] = refunds.get(bets[i][0], 0) + bets[i][1]
+            await balances.credit_many(refunds)
+            raise
+
+        refunds = {}
+        for i in debited:
+            if statuses.get(i) != ACCEPTED:
+                refunds[bets[i][0]] = refunds.get(bets[i][0], 0) + bets[i][1]
+        await balances.credit_many(refunds)
+
+        results = []
+        for i, (user_id, bet_amount, type) in enumerate(bets):
+            if not accepted[i]:
+                results.append(InsufficientFunds(f"User {user_id} needs {bet_amount}"))
+            elif statuses.get(i) == ACCEPTED:
+                results.append(next(game_users))
+            elif statuses.get(i) == DUPLICATE:
+                results.append(AlreadyJoined(f"User {user_id} already has a bet on {type} in this round"))
+            else:
+                await state.queue({"user_id": user_id, "bet_amount": bet_amount, "type": type})
+                results.append(None)
+        print(f"Committed {len(joined)} of {len(bets)} bets")
+        return results
 
     @classmethod
     def calculate_outcome(cls, server_seed, client_seed, nonce):
@@ -203,105 +233,199 @@ class RouletteConsumer(AsyncWebsocketConsumer):
         return number % 37
 
     @classmethod
-    async def start_game(cls):
-        try:
-            cls.game_running = False
-            global waiting_queue
+    @database_sync_to_async
+    def last_chain_index(cls):
+        from django.db.models import Max
+        from .models import RouletteGame
+        last = RouletteGame.objects.aggregate(Max("chain_index"))["chain_index__max"]
+        return -1 if last is None else last
 
-            if not (is_connected := cache.get("roulette_websocket_connected")) or cls.game_running:
-                return
-            
-            print("Creating game in DB")
+    @classmethod
+    @database_sync_to_async
+    def last_nonce(cls):
+        from django.db.models import Max
+        from .models import RouletteGame
+        last = RouletteGame.objects.aggregate(Max("nonce"))["nonce__max"]
+        return -1 if last is None else last
 
-            from asgiref.sync import sync_to_async
-            from .models import RouletteGame
+    @classmethod
+    async def next_round_seed(cls):
+        """
+        (server_seed, hashed_server_seed, nonce, chain_index) for the next round.
+        Pops the precomputed seed chain when it exists, otherwise makes a random seed.
+        """
+        chain = get_chain("roulette")
+        if chain is None:
             server_seed = secrets.token_hex(16)
-            client_seed = "default_client_seed"
-            hashed_input = f"{cls.server_seed}-{cls.client_seed}-{cls.nonce}".encode()
-            hashed_server_seed = hashlib.sha256(hashed_input).hexdigest()
-            nonce = rnd.uniform(0,1)
-            number = cls.calculate_outcome(server_seed,client_seed,nonce)
-            if number == 0:
-                print("Green")
-                outcome = "green"
-                multiplier = 14
-            elif number == 36:
-                print("Bait")
-                outcome = "bait black"
-                multiplier = 7
-            elif number == 1:
-                print("Bait")
-                outcome = "bait red"
-                multiplier = 7
-            elif number % 2 == 1:
-                print("Red")
-                outcome = "red"
-                multiplier = 2
-            elif number % 2 == 0:
-                print("Black")
-                outcome = "black"
-                multiplier = 2
-
-            new_game = await sync_to_async(RouletteGame.objects.create)(
-                server_seed=server_seed,
-                client_seed=client_seed,
-                hashed_server_seed=hashed_server_seed,
-                nonce=nonce,
-                game_running=False,
-                outcome=outcome,
-                number=number
-            )
-            print(new_game)
-            cls.current_game = new_game
-            
-            for player in waiting_queue:
-                print(f"Added user from queue {player}")
-                await cls.add_user_to_game(user_id=player["user_id"], bet_amount=player["bet_amount"], type=player["type"])
-            
-            waiting_queue = []
-            await asyncio.sleep(1)
-            print(f"Game starting... {cls.current_game.id}")
+            # Nonce je brojac rundi, ceo broj kao u bazi, da provera racuna isti hash
+            return server_seed, next_hash(server_seed), await cls.last_nonce() + 1, None
+        if chain.cursor is None:
+            chain.cursor = await cls.last_chain_index() + 1
+        index, server_seed = chain.pop()
+        return server_seed, next_hash(server_seed), index, index
 
-            new_game.game_running = True
+    @classmethod
+    @database_sync_to_async
+    def get_round(cls, game_id):
+        from .models import RouletteGame
+        return RouletteGame.objects.filter(id=game_id).first()
+
+    @classmethod
+    async def prepare_round(cls, previous):
+        """
+        Seeds, outcome, DB row and betting phase of the next round, with the
+        queued bets committed. Runs during the previous round's countdown.
+        Betting only opens over round `previous`, raises StaleRound otherwise.
+        """
+        from asgiref.sync import sync_to_async
+        from .models import RouletteGame
+        state = cls.round_state()
+        server_seed, hashed_server_seed, nonce, chain_index = await cls.next_round_seed()
+        client_seed = cls.client_seed
+        number = cls.calculate_outcome(server_seed,client_seed,nonce)
+        outcome, multiplier = outcome_for(number)
+
+        new_game = await sync_to_async(RouletteGame.objects.create)(
+            server_seed=server_seed,
+            client_seed=client_seed,
+            hashed_server_seed=hashed_server_seed,
+            nonce=nonce,
+            chain_index=chain_index,
+            game_running=False,
+            outcome=outcome,
+            number=number
+        )
+        try:
+            await state.open(new_game.id, previous, hashed_seed=hashed_server_seed)
+        except StaleRound:
+            # Runda nije otvorena, u njoj nema opklada
+            await sync_to_async(new_game.delete)()
+            raise
+        print(f"Prepared {new_game}")
+
+        queued = [(bet["user_id"], bet["bet_amount"], bet["type"]) for bet in await state.drain_queue()]
+        for result in await cls.commit_bets(queued):
+            if isinstance(result, Exception):
+                print(result)
+        await state.publish_snapshot()
+        return new_game
 
-            new_game.server_seed = server_seed
-            new_game.client_seed = client_seed
-            new_game.hashed_server_seed = hashed_server_seed
-            new_game.nonce = nonce
-            new_game.number = number
-            new_game.outcome = outcome
+    @classmethod
+    async def betting_round(cls):
+        """Round left betting by a previous leader, its bets are already debited."""
+        state = await cls.round_state().read(fresh=True)
+        if state.get("phase") != BETTING:
+            return None
+        return await cls.get_round(int(state["round_id"]))
 
+    @classmethod
+    async def running_round(cls):
+        """
+        (game, started_at, bet book) of a round a previous leader left
+        running, None if there is none. A running round whose DB row is
+        gone cannot be settled, it is ended and its bets refunded.
+        """
+        state = await cls.round_state().read(fresh=True)
+        if state.get("phase") != RUNNING:
+            return None
+        game = await cls.get_round(int(state["round_id"]))
+        if game is None:
+            await cls.abandon_round(state["round_id"])
+            return None
+        return game, int(state["started_at"]), await cls.round_state().bets()
 
-            await cls.save_game(new_game)
+    @classmethod
+    async def abandon_round(cls, round_id):
+        """End `round_id` and give back the stakes of its bets."""
+        state = cls.round_state()
+        if not await state.end(round_id):
+            return
+        refunds = {}
+        for bet in (await state.bets()).values():
+            refunds[bet["user_id"]] = refunds.get(bet["user_id"], 0) + bet["bet_amount"]
+        await get_balances().credit_many(refunds)
+        await state.publish_snapshot()
+        print(f"Abandoned round {round_id}, refunded {len(refunds)} users")
 
-            await cls.send_to_group({"hash_server_seed" : new_game.hash_server_seed, "status" : "game_start"})
-            await asyncio.sleep(5)
+    @classmethod
+    async def countdown(cls, previous):
+        """Countdown to the next round while it is prepared after `previous`, returns the prepared game."""
+        async def announce(seconds):
+            await cls.send_to_group({"status" : "game_end", "message" : f"Game will start in {seconds} seconds."})
+        prepare = partial(cls.prepare_round, previous) if await presence.aonline_count("roulette") else None
+        return await countdown(10, announce, prepare)
 
+    @classmethod
+    async def start_game(cls):
+        new_game, cls.next_game = cls.next_game, None
+        started = False
+        cancelled = False
+        try:
+            cls.game_running = False
+            state = cls.round_state()
+
+            # Rundu koju je prethodni lider ostavio u toku novi lider isplacuje po sacuvanom broju
+            resumed = await cls.running_round() if new_game is None else None
+            if resumed is not None:
+                new_game, started_at, book = resumed
+                print(f"Resuming {new_game}")
+            else:
+                if new_game is None:
+                    new_game = await cls.betting_round()
+                if new_game is None:
+                    if not await presence.aonline_count("roulette"):
+                        return
+                    # Hladan start: nema prethodnog odbrojavanja, kratak prozor za opklade
+                    new_game = await cls.prepare_round((await state.read(fresh=True)).get("round_id"))
+                    await asyncio.sleep(1)
+                started_at = int(time.time() * 1000)
+                # Bet book se zatvara, engine ga ucitava za isplatu
+                book = await state.start(new_game.id, started_at=started_at) or {}
+            started = True
+
+            cls.current_game = new_game
+            number, outcome = new_game.number, new_game.outcome
+            print(f"Game starting... {new_game.id}")
+
+            bets = BetArrays(list(book.values()))
+            print(f"{len(bets)} bets, max exposure {max((await state.exposure()).values(), default=0)}")
+            await state.publish_snapshot()
+            await cls.send_to_group({"hash_server_seed" : new_game.hashed_server_seed, "status" : "game_start"})
+            new_game.game_running = True
+            await cls.save_game(new_game)
+            # Tocak se vrti 5 sekundi od started_at, i kad je runda nastavljena
+            await asyncio.sleep(max(0, 5 - (time.time() * 1000 - started_at) / 1000))
+
+            await state.end(new_game.id)
+            await state.add_result({"round_id" : new_game.id, "number" : number, "outcome" : outcome})
+            await state.publish_snapshot(outcome=outcome, number=number)
             await cls.send_to_group({"status" : "game_end", "outcome" : outcome, "number" : number})
             
-            for player in cls.active_users:
-                if cls.active_users[player]["type"] in outcome:
-                    await cls.give_money(player, cls.active_users[player]["bet_amount"] * multiplier)
+            # Svi dobitnici se isplacuju jednim bulk credit-om (jedan Lua script / jedan CASE UPDATE)
+            await get_balances().credit_many(bets.settle(number))
             cls.game_running = False
-            for x in range(10):
-                await asyncio.sleep(1)
-                await cls.send_to_group({"status" : "game_end", "message" : f"Game will start in {10 - x} seconds."})
-            
             print("Game ended, updating DB")
             new_game.game_running = False
             await cls.save_game(new_game)
 
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
         except Exception as e:
             print(f"Error: {e}")
             return
+        finally:
+            # Kad je engine izgubio lease (cancelled) novi lider vec vodi igru, ovde se nista vise ne dira
+            if started and not cancelled:
+                # Sledeca runda se priprema za vreme odbrojavanja
+                cls.next_game = await cls.countdown(new_game.id)
+            elif not cancelled:
+                # Runda nije krenula, njene opklade cekaju sledeci pokusaj
+                cls.next_game = new_game
         
     @classmethod
     async def send_to_group(cls, message):
-        cls.channel_layer = get_channel_layer()
-        await cls.channel_layer.group_send(
-            "roulette_game",
-            {"type": "send_message", "message": json.dumps(message)}
-        )
+        await broadcast.group_send("roulette_game", message)
 
     @classmethod
     async def save_game(cls, game=None):
@@ -309,6 +433,3 @@ class RouletteConsumer(AsyncWebsocketConsumer):
             game = cls.current_game
         from asgiref.sync import sync_to_async
         await sync_to_async(game.save)()
-
-    async def send_message(self, event):
-        await self.send(event["message"])
\ No newline at end of file
@@ -0,0 +1,31 @@
+import asyncio
+from channels.layers import get_channel_layer
+from kockarnica import presence
+from .consumers import RouletteConsumer
+
+
+async def players_present():
+    return await presence.aonline_count("roulette") > 0
+
+
+async def wait_for_players():
+    """Sleep on the engine control channel until a player connects."""
+    channel_layer = get_channel_layer()
+    while not await players_present():
+        await channel_layer.receive(RouletteConsumer.engine_channel)
+
+
+async def game_loop():
+    print("Roulette Waiting for WebSocket connection...")
+    while True:
+        try:
+            await wait_for_players()
+            print("WebSocket connected. Starting game...")
+            RouletteConsumer.game_running = True  
+            await RouletteConsumer().start_game()  
+            RouletteConsumer.game_running = False
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(e)
+            await asyncio.sleep(1)
@@ -0,0 +1,144 @@
+"""
+European roulette bets and payouts.
+
+Every bet position (a straight number, a split, a street, ... or one of
+the house colour bets) is a column of PAYOUT_MATRIX, a 37 x N array of
+the multiplier each position pays when the wheel lands on each number
+(bet included, 0 means lost). Positions are named by a key:
+
+    straight:17  split:1-2  street:1-2-3  corner:1-2-4-5
+    dozen:1..3  column:1..3  odd  even  low  high
+    red  black  green  bait red  bait black
+
+Settling a round is one row lookup over the round's columnar bet arrays.
+"""
+import numpy as np
+
+
+def outcome_for(number):
+    """(outcome, multiplier) for a wheel result 0..36."""
+    if number == 0:
+        return "green", 14
+    if number == 36:
+        return "bait black", 7
+    if number == 1:
+        return "bait red", 7
+    if number % 2 == 1:
+        return "red", 2
+    return "black", 2
+
+
+# Precomputed outcome -> (bet type, multiplier) for every pocket of the wheel
+OUTCOMES = tuple(outcome_for(number) for number in range(37))
+
+INSIDE_BETS = ("straight", "split", "street", "corner")
+OUTSIDE_BETS = ("dozen", "column")
+
+
+def _positions():
+    """[(key, numbers, multiplier)] for every bet position on the table."""
+    positions = [(f"straight:{n}", (n,), 36) for n in range(37)]
+
+    splits = [(0, 1), (0, 2), (0, 3)]
+    splits += [(n, n + 1) for n in range(1, 37) if n % 3 != 0]
+    splits += [(n, n + 3) for n in range(1, 34)]
+    positions += [(f"split:{a}-{b}", (a, b), 18) for a, b in splits]
+
+    streets = [(0, 1, 2), (0, 2, 3)] + [(n, n + 1, n + 2) for n in range(1, 37, 3)]
+    positions += [("street:" + "-".join(map(str, s)), s, 12) for s in streets]
+
+    corners = [(0, 1, 2, 3)] + [(n, n + 1, n + 3, n + 4) for n in range(1, 33) if n % 3 != 0]
+    positions += [("corner:" + "-".join(map(str, c)), c, 9) for c in corners]
+
+    positions += [(f"dozen:{d}", tuple(range(12 * d - 11, 12 * d + 1)), 3) for d in (1, 2, 3)]
+    positions += [(f"column:{c}", tuple(range(c, 37, 3)), 3) for c in (1, 2, 3)]
+    positions += [
+        ("odd", tuple(range(1, 37, 2)), 2),
+        ("even", tuple(range(2, 37, 2)), 2),
+        ("low", tuple(range(1, 19)), 2),
+        ("high", tuple(range(19, 37)), 2),
+    ]
+
+    # Kucne boje: odd/even sa "bait" brojevima 1 i 36 (tacno poredjenje, "red" ne dobija na "bait red")
+    for outcome in dict.fromkeys(outcome for outcome, _ in OUTCOMES):
+        numbers = tuple(n for n in range(37) if OUTCOMES[n][0] == outcome)
+        positions.append((outcome, numbers, OUTCOMES[numbers[0]][1]))
+    return positions
+
+
+POSITIONS = _positions()
+POSITION_INDEX = {key: i for i, (key, _, _) in enumerate(POSITIONS)}
+BET_TYPES = frozenset(POSITION_INDEX)
+# Sta klijent moze da posalje kao "type"
+BET_KINDS = INSIDE_BETS + OUTSIDE_BETS + tuple(key for key, _, _ in POSITIONS if ":" not in key)
+
+
+def _payout_matrix():
+    matrix = np.zeros((37, len(POSITIONS)), dtype=np.float64)
+    for column, (_, numbers, multiplier) in enumerate(POSITIONS):
+        matrix[list(numbers), column] = multiplier
+    return matrix
+
+
+PAYOUT_MATRIX = _payout_matrix()
+
+
+def position_key(bet_type, numbers=None, index=None):
+    """
+    Key of a bet position from a join message, None if there is no such
+    position: inside bets list their `numbers`, dozens and columns give
+    an `index` 1..3, the rest are named by `bet_type` alone.
+    """
+    if bet_type in INSIDE_BETS:
+        try:
+            numbers = sorted(int(n) for n in numbers)
+        except (TypeError, ValueError):
+            return None
+        key = f"{bet_type}:" + "-".join(map(str, numbers))
+    elif bet_type in OUTSIDE_BETS:
+        key = f"{bet_type}:{index}"
+    else:
+        key = bet_type
+    return key if key in POSITION_INDEX else None
+
+
+def payout(bet_type, number):
+    """Multiplier paid to a `bet_type` position when the wheel lands on `number`, 0 if the bet lost."""
+    return PAYOUT_MATRIX[number, POSITION_INDEX[bet_type]]
+
+
+def payout_column(bet_type):
+    """Multiplier paid to a `bet_type` position for every number 0..36."""
+    return PAYOUT_MATRIX[:, POSITION_INDEX[bet_type]]
+
+
+def exposure(bets):
+    """
+    What the house pays for every number 0..36 on [(bet type, bet_amount)],
+    used to grow the round's exposure as bets arrive.
+    """
+    if not bets:
+        return np.zeros(37)
+    columns = np.fromiter((POSITION_INDEX[bet_type] for bet_type, _ in bets), dtype=np.intp, count=len(bets))
+    amounts = np.fromiter((amount for _, amount in bets), dtype=np.float64, count=len(bets))
+    return PAYOUT_MATRIX[:, columns] @ amounts
+
+
+class BetArrays:
+    """Columnar view of a closed bet book: user ids, position columns and amounts."""
+
+    def __init__(self, bets):
+        self.user_ids = np.fromiter((bet["user_id"] for bet in bets), dtype=np.int64, count=len(bets))
+        self.columns = np.fromiter((POSITION_INDEX[bet["type"]] for bet in bets), dtype=np.intp, count=len(bets))
+        self.amounts = np.fromiter((bet["bet_amount"] for bet in bets), dtype=np.float64, count=len(bets))
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def settle(self, number):
+        """{user_id: amount won} when the wheel lands on `number`."""
+        wins = self.amounts * PAYOUT_MATRIX[number, self.columns]
+        winners = wins > 0
+        users, inverse = np.unique(self.user_ids[winners], return_inverse=True)
+        totals = np.bincount(inverse, weights=wins[winners], minlength=len(users))
+        return {int(user_id): float(total) for user_id, total in zip(users, totals)}
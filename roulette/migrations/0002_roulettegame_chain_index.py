@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("roulette", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="roulettegame",
+            name="chain_index",
+            field=models.IntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("roulette", "0002_roulettegame_chain_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="roulettegameuser",
+            name="bet_type",
+            field=models.CharField(default="", max_length=32),
+        ),
+    ]
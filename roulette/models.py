@@ -8,6 +8,7 @@ class RouletteGameUser(models.Model):
     game = models.ForeignKey("roulette.RouletteGame", on_delete=models.CASCADE, related_name="players")
     user = models.ForeignKey("users.User", on_delete=models.CASCADE)
     bet_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    bet_type = models.CharField(max_length=32, default="")
 
     def __str__(self):
         return f"{self.user.email} in game {self.game.id}"
@@ -27,6 +28,7 @@ class RouletteGame(models.Model):
     client_seed = models.CharField(max_length=64,default="default_client_seed")
     hashed_server_seed = models.CharField(max_length=64)
     nonce = models.IntegerField(default=0)
+    chain_index = models.IntegerField(null=True, blank=True, unique=True)
     game_running = models.BooleanField(default=False)
     number = models.IntegerField()
     outcome = models.CharField(max_length=64, default="red")
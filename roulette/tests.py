@@ -1,3 +1,89 @@
-from django.test import TestCase
+from collections import Counter
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .gamemechanics import PAYOUT_MATRIX, POSITIONS, BetArrays, exposure, payout, payout_column, position_key
+
+
+def bet(user_id, type, bet_amount):
+    return {"user_id": user_id, "type": type, "bet_amount": bet_amount}
+
+
+class PayoutMatrixTests(SimpleTestCase):
+    def test_positions_per_bet_type(self):
+        counts = Counter(key.split(":")[0] for key, _, _ in POSITIONS)
+        self.assertEqual(counts["straight"], 37)
+        self.assertEqual(counts["split"], 60)
+        self.assertEqual(counts["street"], 14)
+        self.assertEqual(counts["corner"], 23)
+        self.assertEqual(counts["dozen"], 3)
+        self.assertEqual(counts["column"], 3)
+        for key in ("odd", "even", "low", "high", "red", "black", "green", "bait red", "bait black"):
+            self.assertEqual(counts[key], 1, key)
+        self.assertEqual(PAYOUT_MATRIX.shape, (37, len(POSITIONS)))
+
+    def test_table_bets_return_36_units_over_the_wheel(self):
+        # Svaka pozicija sa stola (bez kucnih boja) isplacuje ukupno 36 preko svih 37 brojeva
+        for key, numbers, multiplier in POSITIONS:
+            if key.split(":")[0] in ("straight", "split", "street", "corner", "dozen", "column", "odd", "even", "low", "high"):
+                self.assertEqual(payout_column(key).sum(), 36, key)
+                self.assertEqual(int((payout_column(key) > 0).sum()), len(numbers), key)
+
+    def test_zero_loses_outside_bets(self):
+        for key in ("odd", "even", "low", "high", "dozen:1", "column:1", "red", "black"):
+            self.assertEqual(payout(key, 0), 0, key)
+        self.assertEqual(payout("green", 0), 14)
+
+    def test_colour_matches_the_outcome_exactly(self):
+        # "red" ne dobija na "bait red" (1), "black" ne dobija na "bait black" (36)
+        self.assertEqual(payout("red", 1), 0)
+        self.assertEqual(payout("bait red", 1), 7)
+        self.assertEqual(payout("black", 36), 0)
+        self.assertEqual(payout("bait black", 36), 7)
+        self.assertEqual(payout("red", 3), 2)
+        self.assertEqual(payout("black", 2), 2)
+
+    def test_exposure(self):
+        payouts = exposure([("straight:17", 10), ("odd", 5)])
+        self.assertEqual(payouts[17], 370)
+        self.assertEqual(payouts[3], 10)
+        self.assertEqual(payouts[2], 0)
+        self.assertEqual(exposure([]).tolist(), [0] * 37)
+
+
+class PositionKeyTests(SimpleTestCase):
+    def test_inside_bets_sort_their_numbers(self):
+        self.assertEqual(position_key("split", [2, 1]), "split:1-2")
+        self.assertEqual(position_key("straight", ["17"]), "straight:17")
+        self.assertEqual(position_key("corner", [5, 4, 2, 1]), "corner:1-2-4-5")
+        self.assertEqual(position_key("street", [0, 1, 2]), "street:0-1-2")
+
+    def test_outside_and_named_bets(self):
+        self.assertEqual(position_key("dozen", index=2), "dozen:2")
+        self.assertEqual(position_key("column", index=3), "column:3")
+        self.assertEqual(position_key("bait red"), "bait red")
+
+    def test_unknown_positions(self):
+        self.assertIsNone(position_key("split", [1, 3]))
+        self.assertIsNone(position_key("straight", [37]))
+        self.assertIsNone(position_key("straight", None))
+        self.assertIsNone(position_key("straight", ["x"]))
+        self.assertIsNone(position_key("dozen", index=4))
+        self.assertIsNone(position_key("purple"))
+
+
+class SettleTests(SimpleTestCase):
+    def test_settle_sums_every_winning_bet_of_a_user(self):
+        bets = BetArrays([
+            bet(1, "straight:17", 10),
+            bet(1, "odd", 5),
+            bet(1, "even", 5),
+            bet(2, "even", 5),
+            bet(3, "red", 1),
+        ])
+        self.assertEqual(bets.settle(17), {1: 370.0, 3: 2.0})
+
+    def test_settle_without_winners(self):
+        bets = BetArrays([bet(1, "red", 10), bet(2, "dozen:3", 10)])
+        self.assertEqual(bets.settle(0), {})
+        self.assertEqual(BetArrays([]).settle(5), {})
@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+import asyncio
+import atexit
+import os
+import threading
 
 
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .models import User
+        from .tokencache import invalidate_user_tokens
+        post_save.connect(invalidate_user_tokens, sender=User)
+        post_delete.connect(invalidate_user_tokens, sender=User)
+
+        if os.environ.get("RUN_MAIN") != "true":  # Prevent duplicate execution
+            return
+        from django.conf import settings
+        # Bez engine-a u procesu flusher pokrece `manage.py run_game_engines`
+        if settings.BALANCES["BACKEND"] != "redis" or not settings.GAME_ENGINES["IN_PROCESS"]:
+            return
+        from .balances import get_balances
+        atexit.register(get_balances().flush)  # Upisi preostale balanse pri gasenju
+        thread = threading.Thread(target=self.run_balance_flusher, daemon=True)
+        thread.start()
+
+    def run_balance_flusher(self):
+        from .balances import get_balances
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(get_balances().flush_forever())
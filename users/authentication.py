@@ -1,9 +1,5 @@
 from rest_framework.authentication import BaseAuthentication
-from django.contrib.auth import get_user_model
-from rest_framework.exceptions import AuthenticationFailed
-from .utils import decode_jwt
-
-User = get_user_model()
+from .tokencache import authenticate_token
 
 class JWTAuthentication(BaseAuthentication):
     def authenticate(self, request):
@@ -13,13 +9,5 @@ class JWTAuthentication(BaseAuthentication):
             return None
 
         token = auth_header.split(" ")[1]
-        payload = decode_jwt(token)
-        if not payload:
-            raise AuthenticationFailed("Invalid or expired token")
-
-        try:
-            user = User.objects.get(id=payload["id"])
-        except User.DoesNotExist:
-            raise AuthenticationFailed("User not found")
-
+        payload, user = authenticate_token(token)
         return (user, None)
@@ -0,0 +1,261 @@
+"""
+Balance ledger used by the bet and payout paths of both games.
+
+BALANCES["BACKEND"] picks the implementation:
+
+"redis": hot balances kept in Redis with write-behind persistence.
+Balances live under balance:<user_id> as integer cents. Debits and
+credits are single Lua scripts, so a debit is accepted only if enough
+funds remain and concurrent rounds cannot lose updates. Every changed
+user id goes into a dirty set that `flush` persists into
+users.User.balance in one bulk update. While a balance is cached, the
+cache is authoritative.
+
+Debits, credits and loads go through redis.asyncio on the caller's
+event loop, so bet batches and payouts never block the consumers or the
+engine. Only the flusher, which runs in a thread or at exit, uses the
+synchronous django_redis client.
+
+"database": every debit and credit is one conditional UPDATE on
+users_user, the updated row count is the accept/reject signal.
+"""
+import asyncio
+import uuid
+
+import redis
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from kockarnica.roundstate import get_async_client, run_script
+
+DIRTY_KEY = "balances:dirty"
+
+# ARGV = amounts..., dirty set key, user ids...
+# Returns per key 1 if debited, 0 if funds are insufficient and -1 if the
+# balance is not loaded yet.
+DEBIT_SCRIPT = """
+local result = {}
+for i, key in ipairs(KEYS) do
+    local balance = redis.call('GET', key)
+    if not balance then
+        result[i] = -1
+    elseif tonumber(balance) < tonumber(ARGV[i]) then
+        result[i] = 0
+    else
+        redis.call('DECRBY', key, ARGV[i])
+        redis.call('SADD', ARGV[#KEYS + 1], ARGV[#KEYS + 1 + i])
+        result[i] = 1
+    end
+end
+return result
+"""
+
+CREDIT_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 0 then return {-1, i} end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('INCRBY', key, ARGV[i])
+    redis.call('SADD', ARGV[#KEYS + 1], ARGV[#KEYS + 1 + i])
+end
+return {1, #KEYS}
+"""
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def to_cents(amount):
+    return int(round(amount * 100))
+
+
+def balance_key(user_id):
+    return f"balance:{user_id}"
+
+
+class RedisBalances:
+    def __init__(self, client=None, async_client=None):
+        if client is None:
+            from django_redis import get_redis_connection
+            client = get_redis_connection("default")
+        self.client = client  # Sinhroni klijent, samo za flush
+        self._async_client = async_client
+
+    @property
+    def async_client(self):
+        return self._async_client if self._async_client is not None else get_async_client()
+
+    @database_sync_to_async
+    def _db_balances(self, user_ids):
+        from users.models import User
+        return dict(User.objects.filter(id__in=user_ids).values_list("id", "balance"))
+
+    async def _load(self, user_ids):
+        """Copy balances from the database for users that are not cached yet."""
+        balances = await self._db_balances(list(user_ids))
+        if not balances:
+            return
+        pipe = self.async_client.pipeline(transaction=False)
+        for user_id, balance in balances.items():
+            pipe.set(balance_key(user_id), to_cents(balance), nx=True)
+        await pipe.execute()
+
+    async def get(self, user_id):
+        cents = await self.async_client.get(balance_key(user_id))
+        if cents is None:
+            await self._load([user_id])
+            cents = await self.async_client.get(balance_key(user_id))
+        return int(cents) / 100 if cents is not None else None
+
+    async def debit(self, user_id, amount):
+        """Take `amount` from the user, raise InsufficientFunds if the balance is too low."""
+        if not (await self.debit_many([(user_id, amount)]))[0]:
+            raise InsufficientFunds(f"User {user_id} needs {amount}")
+
+    async def _run_debit(self, debits):
+        keys = [balance_key(user_id) for user_id, _ in debits]
+        args = [to_cents(amount) for _, amount in debits] + [DIRTY_KEY] + [user_id for user_id, _ in debits]
+        return await run_script(DEBIT_SCRIPT, keys, args, self.async_client)
+
+    async def debit_many(self, debits):
+        """Conditionally debit [(user_id, amount)] in one script call, returns a bool per debit."""
+        if not debits:
+            return []
+        statuses = await self._run_debit(debits)
+        missing = [i for i, status in enumerate(statuses) if status == -1]
+        if missing:
+            await self._load({debits[i][0] for i in missing})
+            for i, status in zip(missing, await self._run_debit([debits[i] for i in missing])):
+                statuses[i] = status
+        return [status == 1 for status in statuses]
+
+    async def credit(self, user_id, amount):
+        await self.credit_many({user_id: amount})
+
+    async def _run_credit(self, user_ids, payouts):
+        keys = [balance_key(user_id) for user_id in user_ids]
+        args = [to_cents(payouts[user_id]) for user_id in user_ids] + [DIRTY_KEY] + user_ids
+        return await run_script(CREDIT_SCRIPT, keys, args, self.async_client)
+
+    async def credit_many(self, payouts):
+        """
+        Credit {user_id: amount} in one script call. Users without a
+        balance even in the database (deleted) are skipped and logged,
+        everyone else is still credited.
+        """
+        if not payouts:
+            return
+        user_ids = list(payouts)
+        status, index = await self._run_credit(user_ids, payouts)
+        if status != -1:
+            return
+        await self._load(user_ids)
+        while user_ids:
+            status, index = await self._run_credit(user_ids, payouts)
+            if status != -1:
+                return
+            # Skripta ne menja nista dok postoji kljuc koji fali, taj korisnik se izbacuje
+            user_id = user_ids.pop(index - 1)
+            print(f"Cannot credit {payouts[user_id]} to user {user_id}, no balance found")
+
+    def _take_dirty(self):
+        """Atomically move the dirty set aside so concurrent flushers never share ids."""
+        flushing_key = f"balances:flushing:{uuid.uuid4().hex}"
+        try:
+            self.client.rename(DIRTY_KEY, flushing_key)
+        except redis.exceptions.ResponseError:  # Dirty set is empty (RENAME on a missing key)
+            return flushing_key, []
+        return flushing_key, [int(user_id) for user_id in self.client.smembers(flushing_key)]
+
+    def flush(self):
+        """Persist every changed balance into users.User.balance in one bulk update."""
+        from users.models import User
+        flushing_key, user_ids = self._take_dirty()
+        if not user_ids:
+            return 0
+        values = self.client.mget([balance_key(user_id) for user_id in user_ids])
+        users = [
+            User(id=user_id, balance=int(cents) / 100)
+            for user_id, cents in zip(user_ids, values) if cents is not None
+        ]
+        try:
+            User.objects.bulk_update(users, ["balance"], batch_size=500)
+        except Exception:
+            # Vrati ih u dirty set da ih sledeci flush pokupi
+            self.client.sadd(DIRTY_KEY, *user_ids)
+            raise
+        finally:
+            self.client.delete(flushing_key)
+        return len(users)
+
+    async def flush_forever(self):
+        interval = settings.BALANCES["FLUSH_INTERVAL"]
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                flushed = await database_sync_to_async(self.flush)()
+                if flushed:
+                    print(f"Flushed {flushed} balances")
+            except Exception as e:
+                print(f"Balance flush error: {e}")
+
+
+class DatabaseBalances:
+    @database_sync_to_async
+    def get(self, user_id):
+        from users.models import User
+        return User.objects.filter(id=user_id).values_list("balance", flat=True).first()
+
+    async def debit(self, user_id, amount):
+        if not (await self.debit_many([(user_id, amount)]))[0]:
+            raise InsufficientFunds(f"User {user_id} needs {amount}")
+
+    @database_sync_to_async
+    def debit_many(self, debits):
+        """
+        UPDATE ... SET balance = balance - amount WHERE id = user_id AND balance >= amount
+        for every [(user_id, amount)] in one transaction, returns a bool per debit.
+        """
+        from django.db import transaction
+        from django.db.models import F
+        from users.models import User
+        with transaction.atomic():
+            return [
+                bool(User.objects.filter(id=user_id, balance__gte=amount).update(balance=F("balance") - amount))
+                for user_id, amount in debits
+            ]
+
+    async def credit(self, user_id, amount):
+        await self.credit_many({user_id: amount})
+
+    @database_sync_to_async
+    def credit_many(self, payouts):
+        """Credit {user_id: amount} in one CASE based UPDATE statement."""
+        from django.db.models import Case, F, FloatField, Value, When
+        from users.models import User
+        if not payouts:
+            return
+        User.objects.filter(id__in=payouts.keys()).update(
+            balance=F("balance") + Case(
+                *[When(id=user_id, then=Value(amount)) for user_id, amount in payouts.items()],
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+
+    def flush(self):
+        return 0
+
+
+_balances = None
+
+
+def get_balances():
+    global _balances
+    if _balances is None:
+        if settings.BALANCES["BACKEND"] == "database":
+            _balances = DatabaseBalances()
+        else:
+            _balances = RedisBalances()
+    return _balances
@@ -0,0 +1,33 @@
+from urllib.parse import parse_qs
+
+from channels.middleware import BaseMiddleware
+from channels.security.websocket import WebsocketDenier
+from rest_framework.exceptions import AuthenticationFailed
+
+from .tokencache import aauthenticate_token
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticates websocket connections from the `token` query parameter.
+    scope["user"] is filled from the verified token cache, connections
+    without a valid token are rejected before the consumer accepts them.
+    """
+
+    async def __call__(self, scope, receive, send):
+        params = parse_qs(scope.get("query_string", b"").decode())
+        token = params.get("token", [None])[0]
+        user = None
+        if token:
+            try:
+                payload, user = await aauthenticate_token(token)
+            except AuthenticationFailed as e:
+                print(f"WebSocket auth failed: {e.detail}")
+        else:
+            print("Token not found in query string")
+
+        if user is None:
+            return await WebsocketDenier.as_asgi()(scope, receive, send)
+
+        scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
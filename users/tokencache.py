@@ -0,0 +1,144 @@
+"""
+Process-local cache of verified JWTs.
+
+A hit skips both the HMAC verification and the users_user lookup. Entries
+live for JWT_SETTINGS["VERIFIED_CACHE_TTL"] seconds (never past the token's
+own exp), the cache holds at most JWT_SETTINGS["VERIFIED_CACHE_SIZE"]
+tokens, and entries are dropped when a token is logged out or its user
+row is saved or deleted.
+
+Logout blacklists a token in the shared Django cache (Redis), so the
+blacklist is checked on every authentication, hit or miss: a token
+logged out through any process is refused everywhere right away.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+
+from .utils import decode_jwt
+
+
+class UserSnapshot:
+    """Lightweight stand-in for users.User carrying only what auth needs."""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, email, is_active, is_staff):
+        self.id = id
+        self.email = email
+        self.is_active = is_active
+        self.is_staff = is_staff
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.email
+
+
+class VerifiedTokenCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expires_at, payload, snapshot)
+        self._by_user = {}  # user_id -> {token}
+        self._lock = threading.Lock()  # Koriste ga i request i engine niti
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return entry[1], entry[2]
+
+    def set(self, token, payload, snapshot):
+        expires_at = min(time.time() + self.ttl, payload.get("exp", float("inf")))
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (expires_at, payload, snapshot)
+            self._by_user.setdefault(snapshot.id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_token(self, token):
+        with self._lock:
+            self._remove(token)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for token in list(self._by_user.get(user_id, ())):
+                self._remove(token)
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._by_user.get(entry[2].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[entry[2].id]
+
+
+token_cache = VerifiedTokenCache(
+    maxsize=settings.JWT_SETTINGS["VERIFIED_CACHE_SIZE"],
+    ttl=settings.JWT_SETTINGS["VERIFIED_CACHE_TTL"],
+)
+
+
+def blacklist_key(token):
+    return f"blacklisted_{token}"
+
+
+def authenticate_token(token):
+    """
+    Return (payload, UserSnapshot) for a valid token.
+    Raises AuthenticationFailed if the token is invalid, expired, logged out or its user is gone.
+    """
+    if cache.get(blacklist_key(token)) is not None:
+        token_cache.invalidate_token(token)
+        raise AuthenticationFailed("Token is blacklisted")
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    payload = decode_jwt(token)
+    if not payload or "id" not in payload:
+        raise AuthenticationFailed("Invalid or expired token")
+
+    from .models import User
+    row = User.objects.filter(id=payload["id"]).values("id", "email", "is_active", "is_staff").first()
+    if row is None:
+        raise AuthenticationFailed("User not found")
+
+    snapshot = UserSnapshot(**row)
+    token_cache.set(token, payload, snapshot)
+    return payload, snapshot
+
+
+async def aauthenticate_token(token):
+    """Async authenticate_token that only leaves the event loop on a cache miss."""
+    from kockarnica.roundstate import get_async_client
+    cached = token_cache.get(token)
+    if cached is None:
+        return await database_sync_to_async(authenticate_token)(token)
+    # Pogodak u kesu i dalje proverava blacklist, jednim EXISTS preko async klijenta
+    if await get_async_client().exists(cache.make_key(blacklist_key(token))):
+        token_cache.invalidate_token(token)
+        raise AuthenticationFailed("Token is blacklisted")
+    return cached
+
+
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """post_save / post_delete receiver for users.User."""
+    token_cache.invalidate_user(instance.id)
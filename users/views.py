@@ -5,6 +5,7 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from .serializers import RegisterSerializer, LoginSerializer
 from .utils import generate_jwt, decode_jwt
+from .tokencache import blacklist_key, token_cache
 from kockarnica import settings
 from django.core.cache import cache
 import jwt
@@ -13,7 +14,7 @@ import jwt
 User = get_user_model()
 
 def is_token_blacklisted(token):
-    return cache.get(f"blacklisted_{token}") is not None
+    return cache.get(blacklist_key(token)) is not None
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -30,7 +31,7 @@ class LoginView(APIView):
                 old_token = request.headers.get("Authorization")
                 if old_token and old_token.startswith("Bearer "):
                     old_token = old_token.split(" ")[1]
-                    cache.delete(f"blacklisted_{old_token}")
+                    cache.delete(blacklist_key(old_token))
                 
                 token = generate_jwt(user)
                 user.is_active = True
@@ -59,7 +60,8 @@ class LogoutView(APIView):
             user = User.objects.get(id=payload["id"])
 
             # Dodaj token na blacklist (koristimo Django cache za skladištenje blokiranih tokena)
-            cache.set(f"blacklisted_{token}", True, timeout=payload["exp"] - payload["iat"])
+            cache.set(blacklist_key(token), True, timeout=payload["exp"] - payload["iat"])
+            token_cache.invalidate_token(token)
 
             return Response({"message": "User logged out successfully"}, status=status.HTTP_200_OK)
 